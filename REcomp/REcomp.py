@@ -4,29 +4,33 @@
 
 import argparse
 import itertools
+import json
 import logging
 import os
 import shutil
+import sys
 import time
 from multiprocessing import Pool, cpu_count
 from pathlib import Path
 
 import numpy as np
-import pandas as pd
 import tqdm
 from Bio import SeqIO
+from natsort import natsorted
 from Bio.Blast.Applications import NcbimakeblastdbCommandline
-from sklearn.cluster import AgglomerativeClustering, KMeans
 
 import config
 from common.align_fasta import FastaAligner
+from common.checkpoint import StageCheckpoint
 from common.check_input import CheckInput
+from common.fasta_index import FastaIndex
 from common.prepare_fasta import PrepFasta as pf
 from common.prime_fasta import PrimeFastaWriter
 from common.prime_fasta_processing import FastaFinalizer
+from common.profiler import StageProfiler
 from common.quick_union import QuickUnion
-from report.report_generator import HtmlReportGenerator
-from report.summary_table import ReportTableConstructor
+from common.thresholds import QcovsHistogram, ThresholdFinder
+from report.report_builder import ReportBuilder
 
 parser = argparse.ArgumentParser(description=(
     "REcomp2 - pipeline for comparative analysis of potentially unlimited"
@@ -39,11 +43,13 @@ parser.add_argument("-v", "--version",
                     version=f"REcomp {config.PIPELINE_VERSION}")
 parser.add_argument("i", help="path(s) to RE results (top level)",
                     type=str,
-                    metavar="path")
+                    metavar="path",
+                    nargs="?")
 parser.add_argument("p", help="prefix(es) for each paths",
                     type=str,
-                    metavar="prefix")
-parser.add_argument("out", help="path to output directory")
+                    metavar="prefix",
+                    nargs="?")
+parser.add_argument("out", help="path to output directory", nargs="?")
 parser.add_argument("-r",
                     "--references",
                     help="path to fasta with references repeats",
@@ -90,15 +96,127 @@ parser.add_argument("-ss", "-superclusters-search",
                     choices=["blastn", "megablast"],
                     default="megablast",
                     dest="task")
+parser.add_argument("--update",
+                    help=(
+                        "add RE results from `path` to comparison in "
+                        "PREV_OUT output directory: only new sequences are "
+                        "aligned against all sequences, alignments of "
+                        "previous run are reused"
+                    ),
+                    metavar="PREV_OUT")
+parser.add_argument("--uf-backend",
+                    help=(
+                        "backend for labeling of connected components: "
+                        "numpy union-find (default) or scipy.sparse "
+                        "connected components (requires scipy)"
+                    ),
+                    choices=["numpy", "scipy"],
+                    default="numpy",
+                    dest="uf_backend")
+parser.add_argument("--qcovs-threshold",
+                    help=(
+                        "fixed query cover threshold (0-100): hits of each "
+                        "'all to all' blast chunk are filtered and united "
+                        "into superclusters as soon as chunk is finished, "
+                        "so hit table is not kept in memory (default: "
+                        "threshold is calculated from all hits)"
+                    ),
+                    type=float,
+                    dest="qcovs_threshold",
+                    metavar="QCOVS")
+parser.add_argument("--report-only",
+                    help=(
+                        "rebuild report table and HTML report of finished "
+                        "run in OUT_DIR from its results (fasta of "
+                        "superclusters, thresholds and RE results) without "
+                        "alignment; only options -l, -c, report and "
+                        "profiling options are used, paths, prefixes and "
+                        "output directory are not given"
+                    ),
+                    dest="report_only",
+                    metavar="OUT_DIR")
+parser.add_argument("--copy-strategy",
+                    help=(
+                        "how graph layouts of clusters are copied into "
+                        "report: hardlink, reflink (copy-on-write clone) or "
+                        "copy; 'auto' tries them in this order (default: "
+                        "auto)"
+                    ),
+                    choices=["auto", "hardlink", "reflink", "copy"],
+                    default=config.COPY_STRATEGY,
+                    dest="copy_strategy")
+parser.add_argument("--export-csv",
+                    help=(
+                        "export report table as CSV "
+                        "(report/superclusters_table.csv) in addition to "
+                        "SQLite database (report/superclusters_table.sqlite)"
+                    ),
+                    action="store_true",
+                    dest="export_csv")
+parser.add_argument("--thumbnails",
+                    help=(
+                        "embed graph layouts into report as thumbnails "
+                        "(requires Pillow)"
+                    ),
+                    action="store_true")
+parser.add_argument("--shared-images",
+                    help=(
+                        "embed each graph layout into report once: images "
+                        "are set by script from one lookup"
+                    ),
+                    action="store_true",
+                    dest="shared_images")
+parser.add_argument("--page-size",
+                    help=(
+                        "write report by pages of SIZE superclusters: "
+                        "report.html is index of superclusters which links "
+                        "to pages (default: one page)"
+                    ),
+                    type=int,
+                    dest="page_size",
+                    metavar="SIZE")
+parser.add_argument("--profile",
+                    help=(
+                        "record wall time, CPU time, peak RSS and I/O of "
+                        "each stage (profile.json in output directory)"
+                    ),
+                    action="store_true")
+parser.add_argument("--cprofile",
+                    help=(
+                        "profile each stage by cProfile in addition to "
+                        "--profile (stats are saved into profile folder of "
+                        "output directory)"
+                    ),
+                    action="store_true")
+
 args = parser.parse_args()
+report_mode = args.report_only is not None
 
 # catch assertions
-assert len(args.p.split()) == len(
-    set(args.p.split())), ("Prefixes are not unique")
-assert len(args.i.split()) == len(
-    set(args.i.split())), ("Paths are not unique")
 assert 0 < args.cpu_number <= cpu_count(), ("CPU count is not valid")
-assert args.evalue >= 0.0, ("Wrong E-value thershold")
+assert args.page_size is None or args.page_size > 0, (
+    "Page size must be positive")
+if report_mode:
+    assert args.i is None and args.p is None and args.out is None, (
+        "Paths, prefixes and output directory are not used with "
+        "--report-only")
+    args.out = args.report_only
+    for path in ["run_info.json", "fasta/thresholds.json",
+                 "results/final_fasta"]:
+        assert Path(args.out).joinpath(path).exists(), (
+            f"{path} is not found: output directory of finished run is "
+            f"expected")
+else:
+    assert args.out is not None, (
+        "Paths to RE results, prefixes and output directory are required")
+    assert len(args.p.split()) == len(
+        set(args.p.split())), ("Prefixes are not unique")
+    assert len(args.i.split()) == len(
+        set(args.i.split())), ("Paths are not unique")
+    assert args.evalue >= 0.0, ("Wrong E-value thershold")
+    assert (args.qcovs_threshold is None or
+            0.0 <= args.qcovs_threshold <= 100.0), (
+        "Wrong query cover threshold")
 
 out_path = Path(args.out)
 out_path.mkdir(parents=True, exist_ok=True)
@@ -106,7 +224,9 @@ out_path.mkdir(parents=True, exist_ok=True)
 # logging
 if args.log:
     logging.basicConfig(level=logging.DEBUG,
-                        filename=Path(args.out).joinpath("REcomp.log"),
+                        filename=Path(args.out).joinpath(
+                            "REcomp_report.log" if report_mode
+                            else "REcomp.log"),
                         format=("\n%(asctime)s - %(funcName)s - "
                                 "%(levelname)s -\n%(message)s\n"),
                         filemode="w")
@@ -132,12 +252,39 @@ logging.info(
     )
 )
 logging.info(args)
+profiler = StageProfiler(out_path, args.profile, args.cprofile,
+                         "profile_report" if report_mode else "profile")
+
+if report_mode:
+    # settings and datasets of run are restored from run info, thresholds
+    # from thresholds.json
+    with open(out_path.joinpath("run_info.json")) as handle:
+        run_info = json.load(handle)
+    for key in ["references", "include_other", "include_ribosomal"]:
+        setattr(args, key, run_info[key])
+    if args.thumbnails:
+        CheckInput().check_module("PIL")
+    report_builder = ReportBuilder(
+        args, run_info["work_dirs"],
+        StageCheckpoint(out_path.joinpath("checkpoints")))
+    profiler.start("ReportTableConstructor")
+    report_builder.report_table(force=True)
+    profiler.start("HtmlReportGenerator")
+    report_builder.html_report(force=True)
+    profiler.log_table()
+    report_builder.copy_style()
+    logging.info("DONE")
+    sys.exit(0)
 
 # check input
 check_input = CheckInput()
 check_input.check_blast(os.environ["PATH"])
 if args.references is not None:
     check_input.check_references(args.references)
+if args.uf_backend == "scipy":
+    check_input.check_module("scipy")
+if args.thumbnails:
+    check_input.check_module("PIL")
 work_dirs = {path: prefix for path, prefix in zip(
     args.i.split(), args.p.split())}
 check_table = check_input.print_check_table(work_dirs)
@@ -158,184 +305,352 @@ prime_fasta.mkdir(parents=True, exist_ok=True)
 final_fasta = Path(args.out).joinpath("results", "final_fasta")
 final_fasta.mkdir(parents=True, exist_ok=True)
 
+checkpoint = StageCheckpoint(out_path.joinpath("checkpoints"))
+united_fasta = fasta_path.joinpath("fasta.fasta")
+united_index = fasta_path.joinpath("fasta.fasta.idx")
+connectivity_table = fasta_path.joinpath("connectivity_table.npy")
+thresholds_file = fasta_path.joinpath("thresholds.json")
+uf_file = fasta_path.joinpath("superclusters.npy")
+references = [args.references] if args.references else []
+
+
+# run info: all datasets of comparison, settings and incremental updates
+run_info_file = out_path.joinpath("run_info.json")
+settings = {"references": args.references,
+            "include_other": args.include_other,
+            "include_ribosomal": args.include_ribosomal,
+            "evalue": args.evalue,
+            "task": args.task,
+            "qcovs_threshold": args.qcovs_threshold}
+if args.update:
+    prev_path = Path(args.update)
+    if not run_info_file.exists():
+        assert prev_path.joinpath("run_info.json").exists(), (
+            "Previous run can't be updated")
+        logging.info(f"copying data of previous run from {prev_path}")
+        shutil.copytree(prev_path.joinpath("fasta"), fasta_path,
+                        dirs_exist_ok=True)
+        shutil.copyfile(prev_path.joinpath("run_info.json"), run_info_file)
+    with open(run_info_file) as handle:
+        run_info = json.load(handle)
+    for key, value in settings.items():
+        assert run_info.get(key) == value, (
+            f"Value of '{key}' differs from previous run")
+    if (run_info["updates"] and
+            run_info["updates"][-1]["work_dirs"] == work_dirs):
+        update = run_info["updates"][-1]  # resume of interrupted update
+    else:
+        assert not set(work_dirs).intersection(run_info["work_dirs"]), (
+            "Paths are already present in previous run")
+        assert not set(work_dirs.values()).intersection(
+            run_info["work_dirs"].values()), (
+            "Prefixes are already present in previous run")
+        update = {"name": f"update_{'_'.join(work_dirs.values())}",
+                  "work_dirs": work_dirs,
+                  "offset": united_fasta.stat().st_size}
+        run_info["updates"].append(update)
+        run_info["work_dirs"].update(work_dirs)
+    gen_path = fasta_path.joinpath(update["name"])
+    gen_offset = update["offset"]
+    stage_prefix = f"{update['name']}_"
+    gen_references = []
+else:
+    run_info = {**settings, "work_dirs": work_dirs, "updates": []}
+    gen_path = fasta_path
+    gen_offset = 0
+    stage_prefix = ""
+    gen_references = references
+with open(run_info_file, "w") as handle:
+    json.dump(run_info, handle, indent=4)
+gen_work_dirs = work_dirs
+work_dirs = run_info["work_dirs"]
+gen_paths = [fasta_path] + [fasta_path.joinpath(upd["name"])
+                            for upd in run_info["updates"]]
+# in streaming mode (fixed query cover threshold) only labels of
+# superclusters and histogram of query cover are stored for each run
+streaming = args.qcovs_threshold is not None
+hits_name = "blast_labels.npz" if streaming else "blast_table.npz"
+hits_tables = [path.joinpath(hits_name) for path in gen_paths]
+
 
 # prepare fasta files with ranks and "others"
-logging.info("creating fasta containing all sequences for analysis")
-for path, prefix in work_dirs.items():
-    fasta_prep = pf(path, args.references, prefix)
-    fasta_prep.create_united_fasta(fasta_path,
-                                   include_other=args.include_other,
-                                   include_ribosomal=args.include_ribosomal)
-if args.references:
-    with open(Path(fasta_path).joinpath("fasta.fasta"), "a") as fasta:
-        for record in SeqIO.parse(args.references, "fasta"):
-            SeqIO.write(record, fasta, "fasta")
+# (in update mode only new datasets are processed and appended to
+# fasta of previous run)
+gen_fasta = gen_path.joinpath("fasta.fasta")
+inputs = list(itertools.chain(*[
+    pf(path, args.references, prefix).input_files(
+        include_other=args.include_other,
+        include_ribosomal=args.include_ribosomal)
+    for path, prefix in gen_work_dirs.items()
+])) + gen_references
+params = {"work_dirs": gen_work_dirs,
+          "include_other": args.include_other,
+          "include_ribosomal": args.include_ribosomal}
+outputs = ([gen_fasta, united_fasta, united_index] if args.update
+           else [gen_fasta, united_index])
+profiler.start("PrepFasta")
+if not checkpoint.is_done(f"{stage_prefix}united_fasta", inputs, params):
+    logging.info("creating fasta containing all sequences for analysis")
+    if not args.update:
+        for path in fasta_path.glob("update_*"):
+            shutil.rmtree(path)
+    gen_path.mkdir(parents=True, exist_ok=True)
+    gen_fasta.unlink(missing_ok=True)
+    for path, prefix in gen_work_dirs.items():
+        fasta_prep = pf(path, args.references, prefix)
+        fasta_prep.create_united_fasta(
+            gen_path,
+            include_other=args.include_other,
+            include_ribosomal=args.include_ribosomal
+        )
+    if gen_references:
+        with open(gen_fasta, "a") as fasta:
+            for record in SeqIO.parse(args.references, "fasta"):
+                SeqIO.write(record, fasta, "fasta")
+    if args.update:
+        with open(united_fasta, "r+b") as fasta, open(gen_fasta, "rb") as new:
+            fasta.truncate(update["offset"])
+            fasta.seek(0, os.SEEK_END)
+            shutil.copyfileobj(new, fasta)
+    # offset index of united fasta (only appended records are scanned)
+    FastaIndex.build(united_fasta, start=gen_offset)
+    checkpoint.save(f"{stage_prefix}united_fasta", inputs, params, outputs)
+profiler.stop()
+
 
+# records of united fasta are encoded by their index
+fasta_index = FastaIndex(united_fasta)
+total_length = fasta_index.total_length
 
 # chunk fasta for parallel
-records_number = 0
-record_iter = SeqIO.parse(
-    open(Path(fasta_path).joinpath("fasta.fasta")), "fasta")
+# (records of chunk are adjacent in united fasta, so chunk is copied as
+# one slice of bytes)
 chunk_size = config.CHUNK_SIZE
 if args.low_memory:
     chunk_size = config.CHUNK_SIZE / 10
-logging.info(f"chunk size: {int(chunk_size)}")
-time.sleep(3)
-for i, batch in enumerate(fasta_prep.batch_iterator(record_iter, chunk_size)):
-    records_number += len(batch)
-    filename = Path(fasta_path).joinpath(f"fasta{i}.fasta")
-    with open(filename, "w") as handle:
-        count = SeqIO.write(batch, handle, "fasta")
-    logging.info(f"saving chunk {'/'.join(filename.parts[-3:])}")
+params = {"chunk_size": chunk_size}
+profiler.start("chunking")
+if not checkpoint.is_done(f"{stage_prefix}chunking", [gen_fasta], params):
+    for file in gen_path.glob("fasta*.fasta"):
+        if any(map(str.isdigit, file.stem)):
+            file.unlink()
+    first = int(np.searchsorted(fasta_index.offsets, gen_offset))
+    logging.info(f"chunk size: {int(chunk_size)}")
+    time.sleep(3)
+    for i, start in enumerate(range(first, len(fasta_index),
+                                    int(chunk_size))):
+        end = min(start + int(chunk_size), len(fasta_index))
+        filename = Path(gen_path).joinpath(f"fasta{i}.fasta")
+        with open(filename, "wb") as handle:
+            handle.write(fasta_index.raw_range(start, end))
+        logging.info(f"saving chunk {'/'.join(filename.parts[-3:])}")
+    files = [path for path in gen_path.glob("*.fasta")
+             if any(map(str.isdigit, Path(path).stem))]
+    checkpoint.save(f"{stage_prefix}chunking", [gen_fasta], params, files)
+profiler.stop()
+chunks = {path: natsorted(file for file in path.glob("*.fasta")
+                          if any(map(str.isdigit, file.stem)))
+          for path in gen_paths}
+files = chunks[gen_path]
+previous_files = list(itertools.chain(*[
+    chunks[path] for path in gen_paths[:gen_paths.index(gen_path)]
+]))
 
 # prepare connectivity table
-cline = NcbimakeblastdbCommandline(
-    input_file=Path(fasta_path).joinpath("fasta.fasta"),
-    dbtype="nucl"
-)
-cline()
-logging.info("running all to all blast")
-fasta_aligner = FastaAligner(args.evalue,
-                             args.task,
-                             Path(fasta_path).joinpath("fasta.fasta"))
-files = [path for path in fasta_path.rglob("*.fasta")
-         if any(map(str.isdigit, Path(path).stem))]
-print(f"Running in {args.cpu_number} cpu(s) in parallel")
-time.sleep(3)
-pool = Pool(processes=args.cpu_number)
-result = tqdm.tqdm(pool.imap_unordered(fasta_aligner.align_fasta, files),
-                   total=len(files))
-blast_table = pd.concat(result)
-pool.close()
-logging.info("all to all blast finished")
-blast_table = blast_table[blast_table["qseqid"] != blast_table["sseqid"]]
-logging.info("removing of junk alignments")
-if args.include_other:
-    kmeans = KMeans(n_clusters=2).fit(blast_table[["qcovs"]].to_numpy())
-else:
-    kmeans = AgglomerativeClustering(linkage="single").fit(
-        blast_table[["qcovs"]].to_numpy())
-bt_kmeans = np.concatenate((blast_table.to_numpy(),
-                            kmeans.labels_.reshape(-1, 1)), axis=1)
-blast_table = pd.DataFrame(data=bt_kmeans[0:, 0:])
-blast_table = blast_table.rename(columns={0: "qseqid",
-                                          1: "sseqid",
-                                          2: "pident",
-                                          3: "qcovs",
-                                          4: "cluster"})
-if (min(list(itertools.chain(*blast_table[blast_table["cluster"] ==
-                                          0][["qcovs"]].values.tolist()))) >
-    min(list(itertools.chain(*blast_table[blast_table["cluster"] ==
-                                          1][["qcovs"]].values.tolist())))):
-    ok_cluster = 0
-else:
-    ok_cluster = 1
-ok_qcovs = min(list(itertools.chain(*blast_table[blast_table["cluster"] ==
-                                                 ok_cluster][["qcovs"]].
-                                    values.tolist())))
-ok_pident = min(list(itertools.chain(*blast_table[blast_table["cluster"] ==
-                                                  ok_cluster][["pident"]].
-                                     values.tolist())))
-blast_table = blast_table[blast_table["cluster"] == ok_cluster]
-blast_table.sort_values(["qseqid", "sseqid"], 0,
-                        inplace=True, ignore_index=True)
-blast_table.drop_duplicates(keep="first", inplace=True, ignore_index=True)
-con_table = list(blast_table.to_records(index=False))
-
-
-# prepare data for UF
-map_dict = {}
-counter = 0
-for record in SeqIO.parse(Path(fasta_path).joinpath("fasta.fasta"), "fasta"):
-    map_dict[record.id] = counter
-    counter += 1
-blast_table["qseqid"] = blast_table["qseqid"].map(map_dict)
-blast_table["sseqid"] = blast_table["sseqid"].map(map_dict)
-
-
-# quick union
-quick_union = QuickUnion(len(map_dict))
-for pair in blast_table.itertuples(index=False, name=None):
-    quick_union.union(pair[0], pair[1])
-uf_repr = [int(i) for i in str(quick_union).split()]
-cc_num = set(uf_repr)
+# (database is built for each chunk: chunk is aligned only against itself,
+# chunks after it and chunks of previous runs in update mode)
+profiler.start("makeblastdb")
+if not checkpoint.is_done(f"{stage_prefix}blast_database", files, {}):
+    for file in files:
+        cline = NcbimakeblastdbCommandline(
+            input_file=file,
+            dbtype="nucl"
+        )
+        cline()
+    checkpoint.save(f"{stage_prefix}blast_database", files, {},
+                    sorted(gen_path.glob("fasta[0-9]*.fasta.*")))
+profiler.stop()
+database = list(itertools.chain(*[
+    sorted(path.glob("fasta[0-9]*.fasta.*")) for path in gen_paths
+]))
+
+gen_hits_table = gen_path.joinpath(hits_name)
+inputs = files + previous_files + database
+params = {"evalue": args.evalue,
+          "task": args.task,
+          "qcovs_threshold": args.qcovs_threshold}
+profiler.start("FastaAligner")
+if not checkpoint.is_done(f"{stage_prefix}all_to_all_blast", inputs, params):
+    logging.info("running all to all blast")
+    fasta_aligner = FastaAligner(args.evalue,
+                                 args.task,
+                                 total_length,
+                                 fasta_index)
+    jobs = fasta_aligner.upper_triangle(files, previous_files)
+    print(f"Running in {args.cpu_number} cpu(s) in parallel")
+    time.sleep(3)
+    pool = Pool(processes=args.cpu_number)
+    result = tqdm.tqdm(pool.imap_unordered(fasta_aligner.align_fasta, jobs),
+                       total=len(jobs))
+    # histogram of query cover is collected while chunks are finishing
+    histogram = QcovsHistogram()
+    if streaming:
+        # good edges of chunk are united immediately and hits are dropped
+        quick_union = QuickUnion(len(fasta_index), backend=args.uf_backend)
+        for qseqid, sseqid, qcovs, hsp_pident, hsp_qcovs in result:
+            histogram.update(hsp_qcovs, hsp_pident)
+            ok_edges = qcovs >= args.qcovs_threshold
+            quick_union.union_edges(qseqid[ok_edges], sseqid[ok_edges])
+        pool.close()
+        pool.join()
+        logging.info("all to all blast finished")
+        np.savez(gen_hits_table,
+                 labels=quick_union.labels(),
+                 qcovs_counts=histogram.counts,
+                 qcovs_min_pident=histogram.min_pident)
+    else:
+        edges = []
+        for chunk_edges in result:
+            histogram.update(chunk_edges[4], chunk_edges[3])
+            edges.append(chunk_edges)
+        qseqid, sseqid, qcovs, hsp_pident, hsp_qcovs = [
+            np.concatenate(column) for column in zip(*edges)]
+        pool.close()
+        pool.join()
+        logging.info("all to all blast finished")
+        np.savez(gen_hits_table,
+                 qseqid=qseqid,
+                 sseqid=sseqid,
+                 qcovs=qcovs,
+                 hsp_pident=hsp_pident,
+                 hsp_qcovs=hsp_qcovs,
+                 qcovs_counts=histogram.counts,
+                 qcovs_min_pident=histogram.min_pident)
+    checkpoint.save(f"{stage_prefix}all_to_all_blast", inputs, params,
+                    [gen_hits_table])
+profiler.stop()
+
+params = {"include_other": args.include_other,
+          "qcovs_threshold": args.qcovs_threshold}
+profiler.start("thresholding")
+if not checkpoint.is_done("thresholds", hits_tables, params):
+    logging.info("removing of junk alignments")
+    hits = [np.load(table) for table in hits_tables]
+    if streaming:
+        histogram = QcovsHistogram()
+        for table in hits:
+            histogram.merge(QcovsHistogram(table["qcovs_counts"],
+                                           table["qcovs_min_pident"]))
+        ok_qcovs, ok_pident = histogram.fixed(args.qcovs_threshold)
+        method = "fixed query cover threshold (streaming union)"
+    elif args.include_other:
+        histogram = QcovsHistogram()
+        for table in hits:
+            histogram.merge(QcovsHistogram(table["qcovs_counts"],
+                                           table["qcovs_min_pident"]))
+        ok_qcovs, ok_pident = histogram.otsu()
+        method = "Otsu (optimal 2-means split of query cover histogram)"
+    else:
+        ok_qcovs, ok_pident = ThresholdFinder().largest_gap(
+            np.concatenate([table["hsp_qcovs"] for table in hits]),
+            np.concatenate([table["hsp_pident"] for table in hits]))
+        method = "largest gap between query cover values (single linkage)"
+    con_table = []
+    for table in hits:
+        if streaming:
+            # labels of each run are united as edges element -> root
+            labels = table["labels"]
+            con_table.append(np.stack(
+                (np.arange(len(labels), dtype=labels.dtype), labels),
+                axis=1))
+            continue
+        ok_edges = table["qcovs"] >= ok_qcovs
+        con_table.append(np.stack((table["qseqid"][ok_edges],
+                                   table["sseqid"][ok_edges]), axis=1))
+    np.save(connectivity_table, np.concatenate(con_table))
+    with open(thresholds_file, "w") as handle:
+        json.dump({"ok_qcovs": round(float(ok_qcovs), 3),
+                   "ok_pident": round(float(ok_pident), 3),
+                   "method": method}, handle)
+    checkpoint.save("thresholds", hits_tables, params,
+                    [connectivity_table, thresholds_file])
+profiler.stop()
+with open(thresholds_file) as handle:
+    thresholds = json.load(handle)
+ok_qcovs = thresholds["ok_qcovs"]
+ok_pident = thresholds["ok_pident"]
+threshold_method = thresholds["method"]
+
+
+inputs = [united_fasta, connectivity_table]
+profiler.start("QuickUnion")
+if not checkpoint.is_done("quick_union", inputs, {}):
+    con_table = np.load(connectivity_table)
+
+    # quick union
+    quick_union = QuickUnion(len(fasta_index), backend=args.uf_backend)
+    quick_union.union_edges(con_table[:, 0], con_table[:, 1])
+    np.save(uf_file, quick_union.labels())
+    checkpoint.save("quick_union", inputs, {}, [uf_file])
+profiler.stop()
+uf_labels = np.load(uf_file)
+cc_num = np.unique(uf_labels)
 logging.info(f"{len(cc_num)} superclusters detected")
 time.sleep(3)
 
 
 # create prime fasta with superclusters
-if args.include_other:
-    logging.info("prepare primary fasta")
-else:
-    logging.info("prepare final fasta")
-rev_map_dict = {v: k for k, v in map_dict.items()}  # invert map dict
-prime_fw = PrimeFastaWriter(fasta_path.joinpath("fasta.fasta"),
-                            prime_fasta,
-                            final_fasta,
-                            rev_map_dict,
-                            uf_repr)
-print(f"Running in {args.cpu_number} cpu(s) in parallel")
-time.sleep(3)
-pool = Pool(processes=args.cpu_number)
-for _ in tqdm.tqdm(pool.imap_unordered(prime_fw.write_fasta, cc_num),
-                   total=len(cc_num)):
-    pass
-pool.close()
-
-
-# process prime fasta into final
-if args.include_other:
-    logging.info(
-        "cleaning the primary fasta files from excessive 'other' clusters")
-    fasta = [path for path in prime_fasta.rglob("*.fasta")]
-    fasta_finalizer = FastaFinalizer(prime_fasta,
-                                     final_fasta,
-                                     args.p.split(),
-                                     args.task)
-    pool = Pool(processes=args.cpu_number)
-    pool.map(fasta_finalizer.final_fasta, fasta)
-    pool.close()
-shutil.rmtree(prime_fasta)
+inputs = [united_fasta, uf_file]
+params = {"include_other": args.include_other,
+          "prefixes": list(work_dirs.values()),
+          "task": args.task}
+profiler.start("PrimeFastaWriter")
+if not checkpoint.is_done("superclusters", inputs, params):
+    shutil.rmtree(final_fasta)
+    final_fasta.mkdir(parents=True, exist_ok=True)
+    prime_fasta.mkdir(parents=True, exist_ok=True)
+    if args.include_other:
+        logging.info("prepare primary fasta")
+    else:
+        logging.info("prepare final fasta")
+    # records are routed to files of superclusters in one pass
+    prime_fw = PrimeFastaWriter(fasta_index,
+                                final_fasta,
+                                uf_labels)
+    prime_scl, final_scl = prime_fw.write_fasta()
+    logging.info(f"{len(prime_scl)} primary and {len(final_scl)} final "
+                 f"superclusters fasta written")
+
+    # process prime fasta into final
+    # (superclusters are aligned against their 'other' contigs by batches
+    # of workers, one blastn for each supercluster)
+    if args.include_other:
+        profiler.start("FastaFinalizer")
+        logging.info(
+            "cleaning the primary fasta files from excessive 'other' clusters")
+        fasta_finalizer = FastaFinalizer(prime_fasta,
+                                         final_fasta,
+                                         list(work_dirs.values()),
+                                         args.task,
+                                         fasta_index)
+        batches = fasta_finalizer.batches(uf_labels,
+                                          prime_scl,
+                                          args.cpu_number)
+        pool = Pool(processes=args.cpu_number)
+        pool.map(fasta_finalizer.final_fasta, batches)
+        pool.close()
+        pool.join()
+    checkpoint.save("superclusters", inputs, params, [final_fasta])
+profiler.stop()
+shutil.rmtree(prime_fasta, ignore_errors=True)
 
 
 # report generation
-# create database from all tarean_reports
-db_constructor = ReportTableConstructor()
-clusters_table = pd.DataFrame()
-for path, prefix in work_dirs.items():
-    repex_path = Path(path).joinpath("cluster_report.html")
-    recomp_result_path = out_path.joinpath("report",
-                                           "graph_layouts",
-                                           prefix)
-    table = db_constructor.process_cluster_data(prefix,
-                                                repex_path,
-                                                recomp_result_path)
-    clusters_table = clusters_table.append(table, ignore_index=True)
-recomp_results_table = (
-    db_constructor.recomp_results_database_construct(final_fasta,
-                                                     args.references)
-)
-report_table = (
-    db_constructor.recomp_report_table_generation(recomp_results_table,
-                                                  clusters_table)
-)
-report_table.to_csv(out_path.joinpath("report", "superclusters_table.csv"),
-                    index=False)
-report_generator = (
-    HtmlReportGenerator(out_path.joinpath("report", "superclusters_table.csv"),
-                        out_path.joinpath("report.html"),
-                        args,
-                        ok_qcovs,
-                        ok_pident)
-)
-report_generator.generate_report()
-try:
-    shutil.copyfile(Path.cwd().joinpath("REcomp2",
-                                        "REcomp",
-                                        "report",
-                                        "style1.css"),
-                    out_path.joinpath("style1.css"))
-except FileNotFoundError:
-    shutil.copyfile(Path.cwd().joinpath("report", "style1.css"),
-                    out_path.joinpath("style1.css"))
+report_builder = ReportBuilder(args, work_dirs, checkpoint)
+profiler.start("ReportTableConstructor")
+report_builder.report_table()
+profiler.start("HtmlReportGenerator")
+report_builder.html_report()
+profiler.log_table()
+report_builder.copy_style()
 logging.info("DONE")
@@ -0,0 +1,191 @@
+import importlib.util
+import json
+import logging
+import shutil
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+from Bio import SeqIO
+
+import config
+from common.align_fasta import FastaAligner
+from common.fasta_index import FastaIndex
+from common.prepare_fasta import PrepFasta
+from common.prime_fasta import PrimeFastaWriter
+from common.quick_union import QuickUnion
+from common.thresholds import QcovsHistogram, ThresholdFinder
+from report.report_builder import ReportBuilder
+
+
+class NoCheckpoint:
+    """
+    Checkpoint which never skips stage and saves nothing, so only stage
+    itself is measured
+    """
+
+    def is_done(self, stage, inputs, params):
+        return False
+
+    def save(self, stage, inputs, params, outputs):
+        pass
+
+
+class StageBenchmarks:
+    """
+    Class contains micro-benchmarks of pipeline stages on synthetic RE
+    results. Stages are run in order of pipeline on output of previous
+    stage (hits of 'all to all' BLAST are synthetic), each stage is run
+    several times and wall time of each run is measured. Output folder of
+    stage is cleaned before each run
+    """
+
+    def __init__(self, generator, args):
+        self.generator = generator
+        self.args = args
+        self.out_path = Path(args.out)
+        self.re_results = self.out_path.joinpath("re_results")
+        self.gen_path = self.out_path.joinpath("fasta")
+        self.united_fasta = self.gen_path.joinpath("fasta.fasta")
+        self.thresholds_file = self.gen_path.joinpath("thresholds.json")
+        self.final_fasta = self.out_path.joinpath("results", "final_fasta")
+        self.report_path = self.out_path.joinpath("report")
+        self.results = {}
+        self.work_dirs = {}
+        self.LOGGER = logging.getLogger(__name__)
+        self.LOGGER.setLevel(logging.DEBUG)
+
+    def __measure(self, stage, function, setup=None):
+        """
+        Function does run stage repeatedly (setup is not measured), save
+        wall times of runs and return result of the last run
+        """
+        times = []
+        for _ in range(self.args.repeats):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+        self.results[stage] = {"best": round(min(times), 4),
+                               "median": round(statistics.median(times), 4),
+                               "runs": [round(t, 4) for t in times]}
+        self.LOGGER.info(f"{stage}: best {min(times):.4f} s of "
+                         f"{len(times)} run(s)")
+        return result
+
+    def generate(self):
+        shutil.rmtree(self.re_results, ignore_errors=True)
+        self.work_dirs, self.args.references = self.generator.generate(
+            self.re_results)
+        self.args.references = str(self.args.references)
+        return self.work_dirs
+
+    def __united_fasta(self):
+        for path, prefix in self.work_dirs.items():
+            PrepFasta(path, self.args.references, prefix).create_united_fasta(
+                self.gen_path,
+                include_other=self.args.include_other,
+                include_ribosomal=self.args.include_ribosomal)
+        with open(self.united_fasta, "a") as fasta:
+            for record in SeqIO.parse(self.args.references, "fasta"):
+                SeqIO.write(record, fasta, "fasta")
+        FastaIndex.build(self.united_fasta)
+
+    def __clean_united_fasta(self):
+        shutil.rmtree(self.gen_path, ignore_errors=True)
+        self.gen_path.mkdir(parents=True)
+
+    def __thresholding(self, hits):
+        qseqid, sseqid, pident, qcovs = hits
+        self.__measure("thresholding (largest gap)",
+                       lambda: ThresholdFinder().largest_gap(qcovs, pident))
+
+        def otsu():
+            # histogram is updated by chunks like in streaming of BLAST
+            histogram = QcovsHistogram()
+            for start in range(0, len(qcovs), config.CHUNK_SIZE):
+                histogram.update(qcovs[start:start + config.CHUNK_SIZE],
+                                 pident[start:start + config.CHUNK_SIZE])
+            return histogram.otsu()
+
+        self.__measure("thresholding (Otsu)", otsu)
+        ok_qcovs, ok_pident = ThresholdFinder().largest_gap(qcovs, pident)
+        with open(self.thresholds_file, "w") as handle:
+            json.dump({"ok_qcovs": round(float(ok_qcovs), 3),
+                       "ok_pident": round(float(ok_pident), 3),
+                       "method": "largest gap between query cover values "
+                                 "(single linkage)"}, handle)
+        # thresholds are estimated by hits, records are united by edges
+        first, second, _, covs = FastaAligner.symmetrize(qseqid, sseqid,
+                                                         pident, qcovs)
+        ok_edges = covs >= ok_qcovs
+        return first[ok_edges], second[ok_edges]
+
+    def __quick_union(self, records_number, edges):
+        """
+        Function does measure QuickUnion of good edges and of star graph
+        (the last record is linked to all others, like reference which is
+        appended to the end of united fasta and is similar to many records)
+        """
+        backends = ["numpy"]
+        if importlib.util.find_spec("scipy") is not None:
+            backends.append("scipy")
+        star = (np.full(records_number - 1, records_number - 1),
+                np.arange(records_number - 1))
+        labels = None
+        for backend in backends:
+
+            def union(edges, backend=backend):
+                quick_union = QuickUnion(records_number, backend=backend)
+                quick_union.union_edges(*edges)
+                return quick_union.labels()
+
+            self.__measure(f"QuickUnion star ({backend})",
+                           lambda: union(star))
+            labels = self.__measure(f"QuickUnion ({backend})",
+                                    lambda: union(edges))
+        return labels
+
+    def __clean_final_fasta(self):
+        shutil.rmtree(self.final_fasta, ignore_errors=True)
+        self.final_fasta.mkdir(parents=True)
+
+    def __clean_report_table(self):
+        shutil.rmtree(self.report_path, ignore_errors=True)
+        shutil.rmtree(self.out_path.joinpath("cache"), ignore_errors=True)
+        self.report_path.mkdir(parents=True)
+
+    def __clean_html_report(self):
+        shutil.rmtree(self.report_path.joinpath("pages"), ignore_errors=True)
+        self.out_path.joinpath("report.html").unlink(missing_ok=True)
+
+    def run(self):
+        """
+        Function does run micro-benchmarks of stages on generated RE results
+        and return wall times of stages
+        """
+        self.results = {}
+        self.__measure("PrepFasta", self.__united_fasta,
+                       self.__clean_united_fasta)
+        fasta_index = FastaIndex(self.united_fasta)
+        hits = self.generator.hits(fasta_index.ids)
+        self.LOGGER.info(f"{len(fasta_index)} records, {len(hits[0])} "
+                         f"synthetic hits")
+        edges = self.__thresholding(hits)
+        uf_labels = self.__quick_union(len(fasta_index), edges)
+        self.__measure("PrimeFastaWriter",
+                       PrimeFastaWriter(fasta_index,
+                                        self.final_fasta,
+                                        uf_labels).write_fasta,
+                       self.__clean_final_fasta)
+        report_builder = ReportBuilder(self.args, self.work_dirs,
+                                       NoCheckpoint())
+        self.__measure("ReportTableConstructor",
+                       lambda: report_builder.report_table(force=True),
+                       self.__clean_report_table)
+        self.__measure("HtmlReportGenerator",
+                       lambda: report_builder.html_report(force=True),
+                       self.__clean_html_report)
+        return self.results
@@ -0,0 +1,100 @@
+import json
+import subprocess
+import time
+from pathlib import Path
+
+from prettytable import PrettyTable
+
+
+class BenchmarkResults:
+    """
+    Class contains methods for storing of benchmark results keyed by commit:
+    each run is appended as one JSON line with commit, parameters of run
+    and wall times of stages. Run is compared with the last stored run of
+    another commit (or of given commit) with the same parameters
+    """
+
+    def __init__(self, path_to_results):
+        self.path_to_results = Path(path_to_results)
+
+    @staticmethod
+    def commit():
+        """
+        Function does return hash of current commit of pipeline and whether
+        working tree has uncommitted changes (commit is 'unknown' outside of
+        git). Git is run in folder of pipeline, not in current directory
+        """
+        repository = Path(__file__).resolve().parent
+        try:
+            commit = subprocess.run(["git", "rev-parse", "HEAD"],
+                                    capture_output=True, text=True,
+                                    check=True,
+                                    cwd=repository).stdout.strip()
+            status = subprocess.run(["git", "status", "--porcelain",
+                                     "--untracked-files=no"],
+                                    capture_output=True, text=True,
+                                    check=True,
+                                    cwd=repository).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return "unknown", False
+        return commit, bool(status)
+
+    def runs(self):
+        if not self.path_to_results.exists():
+            return []
+        with open(self.path_to_results) as handle:
+            return [json.loads(line) for line in handle if line.strip()]
+
+    def save(self, params, stages):
+        commit, dirty = self.commit()
+        run = {"commit": commit,
+               "dirty": dirty,
+               "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+               "params": params,
+               "stages": stages}
+        self.path_to_results.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path_to_results, "a") as handle:
+            handle.write(json.dumps(run) + "\n")
+        return run
+
+    def baseline(self, run, commit=None):
+        """
+        Function does return the last stored run with the same parameters
+        of given commit (prefix of hash) or of commit other than commit of
+        run. None if there is no such run
+        """
+        for previous in reversed(self.runs()[:-1]):
+            if previous["params"] != run["params"]:
+                continue
+            if commit is None and previous["commit"] != run["commit"]:
+                return previous
+            if commit is not None and previous["commit"].startswith(commit):
+                return previous
+        return None
+
+    @staticmethod
+    def compare(baseline, run, tolerance):
+        """
+        Function does return table with the best wall times of stages of
+        two runs and list of stages which are slower than baseline by more
+        than tolerance (fraction of baseline time)
+        """
+        table = PrettyTable()
+        table.field_names = ["Stage", "Baseline, s", "Current, s",
+                             "Change, %", "Result"]
+        regressions = []
+        for stage, times in run["stages"].items():
+            if stage not in baseline["stages"]:
+                table.add_row([stage, "", times["best"], "", "new"])
+                continue
+            before = baseline["stages"][stage]["best"]
+            change = (times["best"] - before) / before if before else 0.0
+            mark = ""
+            if change > tolerance:
+                mark = "slower"
+                regressions.append(stage)
+            elif change < -tolerance:
+                mark = "faster"
+            table.add_row([stage, before, times["best"],
+                           round(change * 100, 1), mark])
+        return table, regressions
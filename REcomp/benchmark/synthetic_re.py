@@ -0,0 +1,276 @@
+import json
+import re
+import struct
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+import config
+
+
+class SyntheticREGenerator:
+    """
+    Class contains methods for generation of synthetic RE results of
+    configurable size: for each dataset rank fasta (TAREAN consensuses),
+    folders of clusters with contigs and graph layout and cluster_report.html
+    with table of clusters. Clusters belong to repeat families: most of
+    families are shared by datasets (the same cluster number), the rest of
+    clusters are unique for dataset. Some shared families have reference.
+    Results are reproducible by seed
+    """
+
+    NUCLEOTIDES = np.frombuffer(b"ACGT", dtype=np.uint8)
+    ANNOTATIONS = ["Other",
+                   "Putative satellites (high confidence)",
+                   "Putative satellites (low confidence)",
+                   "Putative LTR elements",
+                   "rDNA"]
+    # probability of 'other' cluster and of ranks 1-4
+    RANK_WEIGHTS = [0.6, 0.1, 0.1, 0.15, 0.05]
+    SHARED_FRACTION = 0.8
+    REFERENCE_STEP = 4
+    MUTATION_RATE = 0.03
+    GOOD_HITS = 2
+    JUNK_HITS = 4
+    LAYOUT_VARIANTS = 8
+    TOTAL_READS = 1000000
+
+    def __init__(self,
+                 datasets=2,
+                 clusters=100,
+                 contigs=3,
+                 min_length=150,
+                 max_length=1000,
+                 layout_size=900,
+                 seed=1):
+        assert datasets > 0 and clusters > 0 and contigs > 0, (
+            "Numbers of datasets, clusters and contigs must be positive")
+        # RE numbers folders of clusters by four digits
+        assert clusters <= 9999, "Number of clusters must be at most 9999"
+        assert 0 < min_length <= max_length, (
+            "Minimal length must be positive and not greater than maximal")
+        assert layout_size > 0, "Size of graph layout must be positive"
+        self.datasets = datasets
+        self.clusters = clusters
+        self.contigs = contigs
+        self.min_length = min_length
+        self.max_length = max_length
+        self.layout_size = layout_size
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.families = {}  # family of (prefix, cluster)
+        self.__seeds = []
+
+    def params(self):
+        return {"datasets": self.datasets,
+                "clusters": self.clusters,
+                "contigs": self.contigs,
+                "min_length": self.min_length,
+                "max_length": self.max_length,
+                "layout_size": self.layout_size,
+                "seed": self.seed}
+
+    def __new_family(self):
+        length = self.rng.integers(self.min_length, self.max_length + 1)
+        self.__seeds.append(self.NUCLEOTIDES[self.rng.integers(0, 4, length)])
+        return len(self.__seeds) - 1
+
+    def __mutate(self, sequence):
+        sequence = sequence.copy()
+        mutated = self.rng.random(len(sequence)) < self.MUTATION_RATE
+        sequence[mutated] = self.NUCLEOTIDES[
+            self.rng.integers(0, 4, mutated.sum())]
+        return sequence
+
+    def __contig(self, family):
+        """
+        Function does return mutated fragment of family sequence (sequence
+        is repeated in tandem if contig is longer)
+        """
+        seed = self.__seeds[family]
+        length = self.rng.integers(self.min_length, self.max_length + 1)
+        start = self.rng.integers(0, len(seed))
+        return self.__mutate(np.resize(np.roll(seed, -start), length))
+
+    @staticmethod
+    def __record(name, sequence, width):
+        sequence = sequence.tobytes()
+        lines = [sequence[i:i + width]
+                 for i in range(0, len(sequence), width)]
+        return b">" + name.encode("utf-8") + b"\n" + b"\n".join(lines) + b"\n"
+
+    def __png(self):
+        """
+        Function does return grayscale PNG of graph layout size: white
+        picture with sparse dark points (it is compressed like layouts of
+        RE)
+        """
+        size = self.layout_size
+        pixels = np.full((size, size), 255, dtype=np.uint8)
+        points = self.rng.random((size, size)) < 0.02
+        pixels[points] = self.rng.integers(0, 128, points.sum())
+        # each scanline starts with filter type 0
+        raw = np.hstack([np.zeros((size, 1), dtype=np.uint8), pixels])
+
+        def chunk(kind, data):
+            return (struct.pack(">I", len(data)) + kind + data +
+                    struct.pack(">I", zlib.crc32(kind + data)))
+
+        return (b"\x89PNG\r\n\x1a\n" +
+                chunk(b"IHDR", struct.pack(">IIBBBBB", size, size,
+                                           8, 0, 0, 0, 0)) +
+                chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)) +
+                chunk(b"IEND", b""))
+
+    def __cluster_report(self, clusters, ranks):
+        """
+        Function does return cluster_report.html with table of clusters as
+        data of DataTables widget (columns of RE table)
+        """
+        weights = 1 / np.arange(1, len(clusters) + 1)
+        proportion = weights / weights.sum() * 100
+        reads = (proportion / 100 * self.TOTAL_READS).astype(int)
+        columns = [[] for _ in range(19)]
+        for i, (cluster, rank) in enumerate(zip(clusters, ranks)):
+            cl_dir = f"seqclust/clustering/clusters/dir_CL{cluster:04d}"
+            layout = f"{cl_dir}/graph_layout.png"
+            values = [
+                str(cluster),
+                f'<a href="{cl_dir}/index.html">{cluster}</a>',
+                f'<a href="seqclust/clustering/superclusters/'
+                f'dir_SC{cluster:04d}/index.html">{cluster}</a>',
+                round(float(proportion[i]), 4),
+                round(float(proportion[i]), 4),
+                int(reads[i]),
+                f'<a href="{layout}"><img border="0" '
+                f'src="{cl_dir}/graph_layout_tmb.png" '
+                f'alt="{cl_dir}/graph_layout_tmb.png"></img></a>',
+                "", None, 1e-05, self.ANNOTATIONS[rank], None, None, "N/A",
+                0.1, 0.5, None, int(reads[i]) * 5, int(reads[i])]
+            for column, value in zip(columns, values):
+                column.append(value)
+        widget = json.dumps({"x": {"filter": "none",
+                                   "data": columns,
+                                   "options": {"pageLength": 1000}}},
+                            separators=(",", ":")).replace("</", "<\\/")
+        return ("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\"/>"
+                "\n<title>Cluster report</title>\n</head>\n<body>\n"
+                "<div id=\"htmlwidget-1\" class=\"datatables html-widget\">"
+                "</div>\n<script type=\"application/json\" "
+                "data-for=\"htmlwidget-1\">"
+                f"{widget}</script>\n"
+                "</body>\n</html>\n")
+
+    def __dataset(self, path, prefix, layouts):
+        ranks = self.rng.choice(len(self.RANK_WEIGHTS), size=self.clusters,
+                                p=self.RANK_WEIGHTS)
+        shared = self.rng.random(self.clusters) < self.SHARED_FRACTION
+        clusters_dir = path.joinpath("seqclust", "clustering", "clusters")
+        rank_fasta = [open(path.joinpath(config.CONSENSUS_FILES[f"RANK{i}"]),
+                           "wb")
+                      for i in range(1, 5)]
+        for cluster, rank, is_shared in zip(range(1, self.clusters + 1),
+                                            ranks, shared):
+            family = cluster - 1 if is_shared else self.__new_family()
+            self.families[(prefix, cluster)] = family
+            cl_dir = clusters_dir.joinpath(f"dir_CL{cluster:04d}")
+            cl_dir.mkdir(parents=True, exist_ok=True)
+            if rank:
+                consensus = self.__mutate(self.__seeds[family])
+                rank_fasta[rank - 1].write(self.__record(
+                    f"CL{cluster}_TR_1_x_{len(consensus)}nt", consensus, 80))
+            with open(cl_dir.joinpath("contigs.fasta"), "wb") as contigs:
+                for contig in range(1, self.contigs + 1):
+                    contigs.write(self.__record(f"CL{cluster}Contig{contig}",
+                                                self.__contig(family), 60))
+            cl_dir.joinpath("graph_layout.png").write_bytes(
+                layouts[cluster % len(layouts)])
+        for handle in rank_fasta:
+            handle.close()
+        path.joinpath("cluster_report.html").write_text(
+            self.__cluster_report(range(1, self.clusters + 1), ranks))
+
+    def generate(self, path_to_output):
+        """
+        Function does write RE results of datasets (folders D1, D2, ...) and
+        fasta of references into output folder and return dictionary of
+        datasets paths and prefixes and path to references
+        """
+        output = Path(path_to_output)
+        output.mkdir(parents=True, exist_ok=True)
+        self.rng = np.random.default_rng(self.seed)
+        self.families = {}
+        self.__seeds = []
+        # families of shared clusters have indices of cluster numbers - 1
+        for _ in range(self.clusters):
+            self.__new_family()
+        layouts = [self.__png() for _ in range(self.LAYOUT_VARIANTS)]
+        work_dirs = {}
+        for dataset in range(1, self.datasets + 1):
+            prefix = f"D{dataset}"
+            path = output.joinpath(prefix)
+            path.mkdir(parents=True, exist_ok=True)
+            self.__dataset(path, prefix, layouts)
+            work_dirs[str(path)] = prefix
+        references = output.joinpath("references.fasta")
+        with open(references, "wb") as handle:
+            for family in range(0, self.clusters, self.REFERENCE_STEP):
+                handle.write(self.__record(
+                    f"reference{family}",
+                    self.__mutate(self.__seeds[family]), 60))
+        return work_dirs, references
+
+    def record_families(self, records_id):
+        """
+        Function does return family of each record of united fasta by its id
+        (prefix_CLn... for RE records, referenceN for references)
+        """
+        families = np.empty(len(records_id), dtype=np.int64)
+        for i, record_id in enumerate(records_id):
+            record_id = (record_id.decode() if isinstance(record_id, bytes)
+                         else record_id)
+            reference = re.fullmatch(r"reference(\d+)", record_id)
+            if reference:
+                families[i] = int(reference.group(1))
+                continue
+            prefix, cluster = re.match(r"([a-zA-Z0-9]+)_CL(\d+)",
+                                       record_id).groups()
+            families[i] = self.families[(prefix, int(cluster))]
+        return families
+
+    def hits(self, records_id):
+        """
+        Function does return synthetic table of 'all to all' BLAST hits
+        (qseqid, sseqid, pident, qcovs) for records of united fasta without
+        self hits: good hits (high query cover) link records of the same
+        family, junk hits (low query cover) link random records
+        """
+        families = self.record_families(records_id)
+        number = len(families)
+        order = np.argsort(families, kind="stable")
+        _, starts, sizes = np.unique(families[order], return_index=True,
+                                     return_counts=True)
+        group = np.repeat(np.arange(len(starts)), sizes)
+        position = np.empty(number, dtype=np.int64)
+        position[order] = np.arange(number)
+        # good hits: random members of family of each record
+        query = np.repeat(np.arange(number), self.GOOD_HITS)
+        member_group = group[position[query]]
+        member = starts[member_group] + (
+            self.rng.random(len(query)) * sizes[member_group]).astype(int)
+        subject = order[member]
+        good = query != subject
+        query, subject = query[good], subject[good]
+        # junk hits: random pairs
+        junk_query = self.rng.integers(0, number, number * self.JUNK_HITS)
+        junk_subject = self.rng.integers(0, number, number * self.JUNK_HITS)
+        qseqid = np.concatenate([query, junk_query]).astype(np.int32)
+        sseqid = np.concatenate([subject, junk_subject]).astype(np.int32)
+        qcovs = np.concatenate([
+            self.rng.integers(70, 101, len(query)),
+            self.rng.integers(1, 41, len(junk_query))]).astype(np.float32)
+        pident = self.rng.uniform(75, 100, len(qseqid)).astype(np.float32)
+        not_self = qseqid != sseqid
+        return (qseqid[not_self], sseqid[not_self],
+                pident[not_self], qcovs[not_self])
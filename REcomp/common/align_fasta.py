@@ -1,33 +1,177 @@
-import pandas as pd
+import subprocess
+from array import array
+
+import numpy as np
 from Bio.Blast.Applications import NcbiblastnCommandline
 
 
 class FastaAligner:
 
+    BATCH_SIZE = 1 << 16
+
     def __init__(self,
                  evalue,
                  task,
-                 database):
+                 dbsize,
+                 fasta_index):
         self.evalue = evalue
         self.task = task
-        self.database = database
+        self.dbsize = dbsize
+        self.fasta_index = fasta_index
+
+    @staticmethod
+    def upper_triangle(chunks, previous_chunks=()):
+        """
+        Function does return alignment schedule as list of (query chunk,
+        subject chunks): each chunk is aligned only against itself, chunks
+        after it and chunks of previous runs, so every pair of sequences is
+        aligned only once
+        """
+        chunks = list(chunks)
+        return [(chunk, chunks[i:] + list(previous_chunks))
+                for i, chunk in enumerate(chunks)]
 
-    def align_fasta(self, fasta):
+    def align_fasta(self, job):
         """
-        Create connectivity table for QU using blast
+        Create connectivity table for QU using blast: query chunk is aligned
+        against databases of subject chunks (effective database size is size
+        of all sequences so E-values do not depend on schedule). Output of
+        blast is parsed line by line into arrays: indices of query and
+        subject (ids are encoded by batches with memory-mapped index of
+        united fasta, that is shared by all workers), identity percent and
+        cover of each HSP. Self hits are removed. Return undirected edges
+        with their cover and identity percent and query cover of HSPs for
+        estimation of thresholds.
+        Pair of sequences from different chunks is aligned in one direction
+        only, so cover of edge is the largest of query cover and subject
+        cover (union of HSPs of pair on subject) and HSP of such pair is
+        counted twice for thresholds: with query cover and with subject
+        cover, as if pair was aligned in both directions like within chunk
         """
+        fasta, subjects = job
+        database = " ".join(str(subject) for subject in subjects)
         cline = NcbiblastnCommandline(query=fasta,
-                                      db=self.database,
+                                      db=f'"{database}"',
+                                      dbsize=self.dbsize,
                                       out="-",
-                                      outfmt="6 qseqid sseqid pident qcovs",
+                                      outfmt=("6 qseqid sseqid pident qcovs "
+                                              "sstart send slen"),
                                       evalue=self.evalue,
                                       task=self.task)
-        output = cline()[0].strip()
-        rows = [line.split() for line in output.splitlines()]
-        cols = ["qseqid", "sseqid", "pident", "qcovs"]
-        data_types = {"qseqid": str,
-                      "sseqid": str,
-                      "pident": float,
-                      "qcovs": float}
-        b_tab = pd.DataFrame(rows, columns=cols).astype(data_types)
-        return b_tab
+        qseqid = array("i")
+        sseqid = array("i")
+        pident = array("f")
+        qcovs = array("f")
+        sstart = array("i")
+        send = array("i")
+        slen = array("i")
+        queries = []
+        subjects = []
+        with subprocess.Popen(str(cline), shell=True,
+                              stdout=subprocess.PIPE,
+                              universal_newlines=True) as blast:
+            for line in blast.stdout:
+                (query, subject, identity, cover,
+                 start, end, length) = line.split()
+                queries.append(query)
+                subjects.append(subject)
+                pident.append(float(identity))
+                qcovs.append(float(cover))
+                sstart.append(int(start))
+                send.append(int(end))
+                slen.append(int(length))
+                if len(queries) == self.BATCH_SIZE:
+                    self.__encode(queries, qseqid)
+                    self.__encode(subjects, sseqid)
+            self.__encode(queries, qseqid)
+            self.__encode(subjects, sseqid)
+        if blast.returncode:
+            raise subprocess.CalledProcessError(blast.returncode, str(cline))
+        qseqid = np.frombuffer(qseqid, dtype=np.int32)
+        sseqid = np.frombuffer(sseqid, dtype=np.int32)
+        pident = np.frombuffer(pident, dtype=np.float32)
+        qcovs = np.frombuffer(qcovs, dtype=np.float32)
+        not_self = qseqid != sseqid
+        qseqid, sseqid = qseqid[not_self], sseqid[not_self]
+        pident, qcovs = pident[not_self], qcovs[not_self]
+        scovs = self.subject_cover(
+            qseqid, sseqid,
+            np.frombuffer(sstart, dtype=np.int32)[not_self],
+            np.frombuffer(send, dtype=np.int32)[not_self],
+            np.frombuffer(slen, dtype=np.int32)[not_self])
+        one_way = ~np.isin(sseqid, self.__chunk_records(fasta))
+        first, second, _, covs = self.symmetrize(qseqid, sseqid, pident,
+                                                 np.maximum(qcovs, scovs))
+        return (first,
+                second,
+                covs,
+                np.concatenate([pident, pident[one_way]]),
+                np.concatenate([qcovs, scovs[one_way]]))
+
+    def __chunk_records(self, fasta):
+        """
+        Function does return indices of records of chunk (by ids in headers)
+        """
+        with open(fasta) as handle:
+            records_id = [line[1:].split(None, 1)[0]
+                          for line in handle if line.startswith(">")]
+        return self.fasta_index.lookup(records_id)
+
+    def __encode(self, records_id, indices):
+        """
+        Function does append indices of records to array and clear batch
+        of ids
+        """
+        indices.frombytes(self.fasta_index.lookup(records_id).tobytes())
+        records_id.clear()
+
+    @staticmethod
+    def subject_cover(qseqid, sseqid, sstart, send, slen):
+        """
+        Function does return subject cover of pair of each hit: percent of
+        subject covered by union of HSPs of pair (rounded like query cover
+        of BLAST). HSPs of each pair are sorted by start on subject and each
+        HSP adds its part after the end of previous HSPs
+        """
+        if not len(qseqid):
+            return np.zeros(0, dtype=np.float32)
+        start = np.minimum(sstart, send).astype(np.int64)
+        end = np.maximum(sstart, send).astype(np.int64)
+        order = np.lexsort((start, sseqid, qseqid))
+        start = start[order]
+        end = end[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = ((qseqid[order][1:] != qseqid[order][:-1]) |
+                     (sseqid[order][1:] != sseqid[order][:-1]))
+        pair = np.cumsum(first) - 1
+        # ends are shifted by pair, so running maximum does not cross pairs
+        shift = pair * (int(end.max()) + 1)
+        previous_end = np.zeros(len(order), dtype=np.int64)
+        previous_end[1:] = np.maximum.accumulate(end + shift)[:-1] - shift[1:]
+        previous_end[first] = 0
+        covered = np.maximum(end - np.maximum(start - 1, previous_end), 0)
+        pair_covered = np.add.reduceat(covered, np.flatnonzero(first))
+        cover = np.empty(len(order), dtype=np.float32)
+        cover[order] = np.rint(100 * pair_covered[pair] / slen[order])
+        return cover
+
+    @staticmethod
+    def symmetrize(qseqid, sseqid, pident, qcovs):
+        """
+        Function does collapse hits into undirected edges (first index is
+        the smallest). Each pair is represented by its best hit: the one
+        with the largest cover and the largest identity percent among them.
+        All hits of pair come from the same query chunk, so edges of
+        different chunks do not overlap
+        """
+        first = np.minimum(qseqid, sseqid)
+        second = np.maximum(qseqid, sseqid)
+        order = np.lexsort((-pident, -qcovs, second, first))
+        first = first[order]
+        second = second[order]
+        best = np.ones(len(order), dtype=bool)
+        best[1:] = (first[1:] != first[:-1]) | (second[1:] != second[:-1])
+        return (first[best],
+                second[best],
+                pident[order[best]],
+                qcovs[order[best]])
@@ -1,3 +1,4 @@
+import importlib.util
 import os
 import subprocess
 
@@ -34,3 +35,7 @@ class CheckInput:
                                                        "-version"]).split()[1].
                               decode("utf-8").split(".")[:2])) < 2.1:
                 raise Exception(f"\n{'blast 2.10.0+ or higher is require'}\n")
+
+    def check_module(self, module):
+        if importlib.util.find_spec(module) is None:
+            raise Exception(f"\n{module} is required but not installed\n")
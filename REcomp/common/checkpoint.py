@@ -0,0 +1,88 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+
+class StageCheckpoint:
+    """
+    Class contains methods for skipping of pipeline stages whose inputs,
+    parameters and outputs have not changed since the previous run
+    """
+
+    BLOCK_SIZE = 1 << 20
+
+    def __init__(self, path_to_manifests):
+        self.path_to_manifests = Path(path_to_manifests)
+        self.path_to_manifests.mkdir(parents=True, exist_ok=True)
+        self.stale = False
+        self.LOGGER = logging.getLogger(__name__)
+        self.LOGGER.setLevel(logging.DEBUG)
+
+    def __hash_file(self, path):
+        sha = hashlib.sha256()
+        with open(path, "rb") as handle:
+            for block in iter(lambda: handle.read(self.BLOCK_SIZE), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def __hash_path(self, path):
+        """
+        Function does return sha256 of file or of all files in directory
+        (with their relative paths). Missing path gives None
+        """
+        path = Path(path)
+        if path.is_file():
+            return self.__hash_file(path)
+        if not path.is_dir():
+            return None
+        sha = hashlib.sha256()
+        for file in sorted(p for p in path.rglob("*") if p.is_file()):
+            sha.update(str(file.relative_to(path)).encode("utf-8"))
+            sha.update(self.__hash_file(file).encode("utf-8"))
+        return sha.hexdigest()
+
+    def __hash_paths(self, paths):
+        return {str(path): self.__hash_path(path) for path in paths}
+
+    def __normalize_params(self, params):
+        return json.loads(json.dumps(params, sort_keys=True, default=str))
+
+    def __manifest_path(self, stage):
+        return self.path_to_manifests.joinpath(f"{stage}.json")
+
+    def is_done(self, stage, inputs, params):
+        """
+        Function does check manifest of stage. Stage is done if no previous
+        stage was rerun and hashes of inputs, parameters and outputs are
+        the same as in manifest
+        """
+        if self.stale:
+            return False
+        manifest_path = self.__manifest_path(stage)
+        if not manifest_path.exists():
+            self.stale = True
+            return False
+        with open(manifest_path) as handle:
+            manifest = json.load(handle)
+        if (manifest["params"] != self.__normalize_params(params) or
+                manifest["inputs"] != self.__hash_paths(inputs) or
+                manifest["outputs"] !=
+                self.__hash_paths(manifest["outputs"].keys())):
+            self.LOGGER.info(f"stage '{stage}' is stale, resuming from it")
+            self.stale = True
+            return False
+        self.LOGGER.info(f"stage '{stage}' is up to date, skipping")
+        return True
+
+    def save(self, stage, inputs, params, outputs):
+        """
+        Function does write manifest with hashes of inputs, parameters and
+        outputs of finished stage
+        """
+        manifest = {"stage": stage,
+                    "inputs": self.__hash_paths(inputs),
+                    "params": self.__normalize_params(params),
+                    "outputs": self.__hash_paths(outputs)}
+        with open(self.__manifest_path(stage), "w") as handle:
+            json.dump(manifest, handle, indent=4)
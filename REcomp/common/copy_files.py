@@ -0,0 +1,80 @@
+import fcntl
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+class FileCopier:
+    """
+    Class contains methods for copying of many small files: each file is
+    hardlinked, reflinked (copy-on-write clone) or copied depending on
+    strategy (the next method is tried if previous one fails). Files are
+    processed by pool of threads and files whose destination has the same
+    size and modification time are skipped
+    """
+
+    STRATEGIES = {"auto": ["hardlink", "reflink", "copy"],
+                  "hardlink": ["hardlink", "copy"],
+                  "reflink": ["reflink", "copy"],
+                  "copy": ["copy"]}
+    FICLONE = 0x40049409  # ioctl of Linux for cloning of file
+
+    def __init__(self, strategy="auto", threads=8):
+        assert strategy in self.STRATEGIES, (
+            f"Unknown copy strategy '{strategy}'")
+        self.methods = [getattr(self, f"_FileCopier__{method}")
+                        for method in self.STRATEGIES[strategy]]
+        self.threads = threads
+
+    def __hardlink(self, source, destination):
+        os.link(source, destination)
+
+    def __reflink(self, source, destination):
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), self.FICLONE, src.fileno())
+        shutil.copystat(source, destination)
+
+    def __copy(self, source, destination):
+        shutil.copy2(source, destination)
+
+    def __is_same(self, source, destination):
+        """
+        Function does check that destination is copy of source by size and
+        modification time
+        """
+        try:
+            dst = os.stat(destination)
+        except FileNotFoundError:
+            return False
+        src = os.stat(source)
+        return (src.st_size == dst.st_size and
+                src.st_mtime_ns == dst.st_mtime_ns)
+
+    def copy_file(self, source, destination):
+        """
+        Function does copy one file by the first method that works and
+        return True if file was copied (False if it was skipped)
+        """
+        if self.__is_same(source, destination):
+            return False
+        Path(destination).parent.mkdir(parents=True, exist_ok=True)
+        for method in self.methods:
+            if os.path.lexists(destination):
+                os.unlink(destination)
+            try:
+                method(source, destination)
+                return True
+            except OSError:
+                if method == self.methods[-1]:
+                    raise
+        return True
+
+    def copy_files(self, pairs):
+        """
+        Function does copy list of (source, destination) pairs by pool of
+        threads and return number of copied files
+        """
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            return sum(executor.map(lambda pair: self.copy_file(*pair),
+                                    pairs))
@@ -0,0 +1,179 @@
+import mmap
+import os
+from io import StringIO
+from pathlib import Path
+
+import numpy as np
+from Bio import SeqIO
+
+
+class FastaIndex:
+    """
+    Class contains offset index of fasta file (like .fai of samtools): for
+    each record its id, byte offset, length of record in bytes and length
+    of sequence (index of record is its position). Index is stored near
+    fasta file as directory of .npy arrays (fasta.fasta.idx) which are
+    memory-mapped, so workers of Pool attach to the same pages by path
+    instead of receiving pickled copies. Records are read from
+    memory-mapped fasta
+    """
+
+    ARRAYS = ["ids", "offsets", "lengths", "seqlens", "sorted_ids", "order"]
+    __attached = {}  # arrays attached by worker process, by path
+
+    def __init__(self, fasta):
+        self.fasta = Path(fasta)
+        self.index_path = Path(f"{self.fasta}.idx")
+        if not self.index_path.joinpath("ids.npy").exists():
+            self.build(self.fasta)
+        self.__load(self.__arrays(self.index_path))
+        self.__mmap = None
+
+    @classmethod
+    def __arrays(cls, index_path):
+        return {name: np.load(index_path.joinpath(f"{name}.npy"),
+                              mmap_mode="r")
+                for name in cls.ARRAYS}
+
+    def __load(self, arrays):
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    def __getstate__(self):
+        return {"fasta": self.fasta, "index_path": self.index_path}
+
+    def __setstate__(self, state):
+        """
+        Arrays are attached once in each worker process
+        """
+        self.__dict__.update(state)
+        key = str(self.index_path)
+        if key not in FastaIndex.__attached:
+            FastaIndex.__attached[key] = self.__arrays(self.index_path)
+        self.__load(FastaIndex.__attached[key])
+        self.__mmap = None
+
+    @classmethod
+    def build(cls, fasta, start=0):
+        """
+        Function does scan fasta file and write its index. If fasta was
+        appended after byte offset `start`, records before it are taken
+        from existing index and only new records are scanned
+        """
+        fasta = Path(fasta)
+        index_path = Path(f"{fasta}.idx")
+        ids, offsets, lengths, seqlens = [], [], [], []
+        if start and index_path.joinpath("ids.npy").exists():
+            previous = cls.__arrays(index_path)
+            kept = int(np.searchsorted(previous["offsets"], start))
+            if kept and (previous["offsets"][kept - 1] +
+                         previous["lengths"][kept - 1] == start):
+                ids = [i.decode() for i in previous["ids"][:kept]]
+                offsets = previous["offsets"][:kept].tolist()
+                lengths = previous["lengths"][:kept].tolist()
+                seqlens = previous["seqlens"][:kept].tolist()
+            else:
+                start = 0
+            del previous
+        else:
+            start = 0
+        with open(fasta, "rb") as handle:
+            handle.seek(start)
+            position = start
+            seqlen = 0
+            for line in handle:
+                if line.startswith(b">"):
+                    if len(lengths) < len(offsets):
+                        lengths.append(position - offsets[-1])
+                        seqlens.append(seqlen)
+                    ids.append(line[1:].split(None, 1)[0].decode())
+                    offsets.append(position)
+                    seqlen = 0
+                else:
+                    seqlen += len(line.rstrip())
+                position += len(line)
+            if len(lengths) < len(offsets):
+                lengths.append(position - offsets[-1])
+                seqlens.append(seqlen)
+        # ids are encoded explicitly: dtype bytes encodes only ASCII
+        ids = np.array([i.encode() for i in ids], dtype=bytes)
+        order = np.argsort(ids, kind="stable").astype(np.int32)
+        arrays = {"ids": ids,
+                  "offsets": np.array(offsets, dtype=np.int64),
+                  "lengths": np.array(lengths, dtype=np.int64),
+                  "seqlens": np.array(seqlens, dtype=np.int64),
+                  "sorted_ids": ids[order],
+                  "order": order}
+        if index_path.is_file():
+            index_path.unlink()
+        index_path.mkdir(parents=True, exist_ok=True)
+        for name, array in arrays.items():
+            # arrays are replaced (not rewritten) so existing memory maps
+            # keep their data
+            tmp = index_path.joinpath(f"{name}.tmp.npy")
+            np.save(tmp, array)
+            os.replace(tmp, index_path.joinpath(f"{name}.npy"))
+        return cls(fasta)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def total_length(self):
+        return int(np.sum(self.seqlens))
+
+    def lookup(self, records_id):
+        """
+        Function does return indices of records by their ids (binary search
+        in sorted ids)
+        """
+        keys = np.array([i.encode() for i in records_id], dtype=bytes)
+        if not len(keys):
+            return np.zeros(0, dtype=np.int32)
+        position = np.searchsorted(self.sorted_ids, keys)
+        position[position == len(self.sorted_ids)] = 0
+        missing = self.sorted_ids[position] != keys
+        if np.any(missing):
+            raise KeyError(keys[missing][0].decode())
+        return self.order[position]
+
+    def __buffer(self):
+        if self.__mmap is None:
+            with open(self.fasta, "rb") as handle:
+                # empty file can not be memory-mapped
+                if os.fstat(handle.fileno()).st_size == 0:
+                    self.__mmap = b""
+                else:
+                    self.__mmap = mmap.mmap(handle.fileno(), 0,
+                                            access=mmap.ACCESS_READ)
+        return self.__mmap
+
+    def raw(self, i):
+        """
+        Function does return record with index i as bytes
+        """
+        return self.__buffer()[self.offsets[i]:
+                               self.offsets[i] + self.lengths[i]]
+
+    def raw_range(self, first, last):
+        """
+        Function does return records from first to last (not included) as
+        bytes: they are adjacent in fasta
+        """
+        if first >= last:
+            return b""
+        return self.__buffer()[self.offsets[first]:
+                               self.offsets[last - 1] + self.lengths[last - 1]]
+
+    def record(self, i):
+        return SeqIO.read(StringIO(self.raw(i).decode()), "fasta")
+
+    def iter_raw(self, indices=None):
+        """
+        Function does yield records (in order of indices or in order of
+        fasta) as bytes
+        """
+        if indices is None:
+            indices = range(len(self))
+        for i in indices:
+            yield self.raw(i)
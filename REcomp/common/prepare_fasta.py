@@ -55,12 +55,29 @@ class PrepFasta:
                 other_dirs.append(d.name)
         return other_dirs
 
+    def __get_ranks_files(self, include_ribosomal):
+        if include_ribosomal:
+            return [self.RANK1, self.RANK2, self.RANK3, self.RANK4]
+        return [self.RANK1, self.RANK2, self.RANK3]
+
+    def input_files(self, include_other=False, include_ribosomal=False):
+        """
+        Function does return list of files which are used for building of
+        united fasta (e.g. for checking of changes between runs)
+        """
+        files = [Path(self.path_to_results).joinpath(file)
+                 for file in self.__get_ranks_files(include_ribosomal)]
+        if include_other:
+            path = Path(self.path_to_results).joinpath("seqclust",
+                                                       "clustering",
+                                                       "clusters")
+            files.extend(Path(path).joinpath(file, "contigs.fasta")
+                         for file in sorted(self.__get_other_dir()))
+        return files
+
     def create_united_fasta(self, path_to_output,
                             include_other=False, include_ribosomal=False):
-        if include_ribosomal:
-            ranks_files = [self.RANK1, self.RANK2, self.RANK3, self.RANK4]
-        else:
-            ranks_files = [self.RANK1, self.RANK2, self.RANK3]
+        ranks_files = self.__get_ranks_files(include_ribosomal)
         with open(Path(path_to_output).joinpath("fasta.fasta"), "a") as out:
             # ranks
             for file in ranks_files:
@@ -84,7 +101,8 @@ class PrepFasta:
                             contig.description = ""
                             SeqIO.write(contig, out, "fasta")
 
-    def batch_iterator(self, iterator, batch_size):
+    @staticmethod
+    def batch_iterator(iterator, batch_size):
         entery = True
         while entery:
             batch = []
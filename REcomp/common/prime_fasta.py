@@ -1,41 +1,94 @@
+from collections import defaultdict
 from pathlib import Path
 
-from Bio import SeqIO
+import numpy as np
 
 
 class PrimeFastaWriter:
+    """
+    Class contains methods for splitting of united fasta into fasta files of
+    superclusters by labels of QuickUnion in one pass. 'Other' contigs of
+    primary superclusters are not written: the best of them is added later
+    by FastaFinalizer
+    """
+
+    SKIP, PRIME, FINAL = 0, 1, 2
+    BUFFER_SIZE = 1 << 26
 
     def __init__(self,
-                 input_fasta,
-                 prime_output,
+                 fasta_index,
                  final_output,
-                 map_dict,
-                 uf_list):
-        self.input_fasta = input_fasta
-        self.prime_output = prime_output
+                 uf_labels):
+        self.fasta_index = fasta_index
         self.final_output = final_output
-        self.map_dict = map_dict
-        self.uf_list = uf_list
-
-    def write_fasta(self, scl_num):
-        ind_list = [i for i, value in enumerate(self.uf_list)
-                    if value == scl_num]
-        id_list = [self.map_dict[i] for i in ind_list]
-        if len(id_list) == 1 and "_TR_1_x_" not in id_list[0] or \
-           len(id_list) == 1 and "Contig" in id_list[0] or \
-           not any("_TR_1_x_" in i for i in id_list):
-            return
-        else:
-            if len(id_list) == 1 and "_TR_1_x_" in id_list[0] or \
-               not any("Contig" in i for i in id_list):
-                file = Path(self.final_output).joinpath(
-                    f"supercluster{scl_num}.fasta"
-                )
-            else:
-                file = Path(self.prime_output).joinpath(
-                    f"supercluster{scl_num}.fasta"
-                )
-            with open(file, "w") as output_fasta:
-                for record in SeqIO.parse(open(self.input_fasta), "fasta"):
-                    if record.id in id_list:
-                        SeqIO.write(record, output_fasta, "fasta")
+        self.uf_labels = np.asarray(uf_labels)
+
+    def classify(self):
+        """
+        Function does return kind of each supercluster (indexed by its root):
+        superclusters without rank clusters are skipped, superclusters of
+        one rank cluster or without 'other' contigs are final and the rest
+        are prime (they have to be cleaned by FastaFinalizer)
+        """
+        labels = self.uf_labels
+        is_rank = np.char.find(self.fasta_index.ids, b"_TR_1_x_") >= 0
+        is_other = self.is_other()
+        size = np.bincount(labels, minlength=len(labels))
+        rank_number = np.bincount(labels, weights=is_rank,
+                                  minlength=len(labels))
+        other_number = np.bincount(labels, weights=is_other,
+                                   minlength=len(labels))
+        kind = np.full(len(labels), self.PRIME, dtype=np.int8)
+        kind[(size == 1) & (rank_number > 0) | (other_number == 0)] = (
+            self.FINAL)
+        kind[(size == 1) & (other_number > 0) | (rank_number == 0)] = (
+            self.SKIP)
+        return kind
+
+    def is_other(self):
+        return np.char.find(self.fasta_index.ids, b"Contig") >= 0
+
+    def __flush(self, buffers, created):
+        """
+        Function does append buffered records of each supercluster to its
+        file (file is opened once per flush) and clear buffers
+        """
+        output = Path(self.final_output)
+        for label, records in buffers.items():
+            file = output.joinpath(f"supercluster{label}.fasta")
+            with open(file, "ab" if label in created else "wb") as handle:
+                handle.writelines(records)
+            created.add(label)
+        buffers.clear()
+
+    def write_fasta(self):
+        """
+        Function does read records of united fasta (from its index) in order
+        and write each record into file of its supercluster. Records are
+        buffered by superclusters and buffers are flushed into files when
+        BUFFER_SIZE bytes are buffered, so each file is opened once per
+        flush however records of superclusters are interleaved. Function
+        returns roots of prime and final superclusters
+        """
+        kind = self.classify()
+        labels = self.uf_labels
+        skip = (kind[labels] == self.SKIP) | (
+            (kind[labels] == self.PRIME) & self.is_other())
+        buffers = defaultdict(list)
+        buffered = 0
+        created = set()
+        for label, record, skipped in zip(labels.tolist(),
+                                          self.fasta_index.iter_raw(),
+                                          skip.tolist()):
+            if skipped:
+                continue
+            buffers[label].append(record)
+            buffered += len(record)
+            if buffered >= self.BUFFER_SIZE:
+                self.__flush(buffers, created)
+                buffered = 0
+        self.__flush(buffers, created)
+        roots = np.flatnonzero(kind != self.SKIP)
+        roots = roots[np.isin(roots, labels)]
+        return (roots[kind[roots] == self.PRIME],
+                roots[kind[roots] == self.FINAL])
@@ -1,54 +1,95 @@
 import numpy as np
 import pandas as pd
-from Bio import SeqIO
 from Bio.Blast.Applications import NcbiblastnCommandline
 
 
 class FastaFinalizer:
+    """
+    Class contains methods for cleaning of primary superclusters from
+    excessive 'other' contigs: only one contig (the best one) is added to
+    final fasta for datasets which have no rank clusters in supercluster.
+    Superclusters are split into batches (one batch for each worker), but
+    each supercluster is aligned by its own blastn, so hits and E-values do
+    not depend on other superclusters of batch
+    """
 
     def __init__(self,
                  path_to_prime,
                  path_to_final,
                  prefix_list,
-                 task):
+                 task,
+                 fasta_index):
         self.path_to_prime = path_to_prime
         self.path_to_final = path_to_final
         self.prefix_list = prefix_list
         self.task = task
+        self.fasta_index = fasta_index
 
-    def final_fasta(self, path_to_fasta):
-        records_id = [record.id for record in SeqIO.parse(path_to_fasta,
-                                                          "fasta")]
+    def __write_records(self, handle, indices):
+        """
+        Function does write records from united fasta by their indices
+        """
+        for i in indices:
+            handle.write(self.fasta_index.raw(i))
+
+    def __contigs(self, members):
+        """
+        Function does return indices of queries (rank clusters) and of
+        candidate contigs ('other' contigs of datasets without rank clusters
+        in supercluster)
+        """
+        records_id = [self.fasta_index.ids[i].decode() for i in members]
         rank_prefixes = [rank_id.split("_")[0] for rank_id in records_id
                          if "_TR_1_x_" in rank_id]
         other_id = [other for other in records_id if "Contig" in other]
         other_prefixes = [oth_id.split("_")[0] for oth_id in other_id]
         require_pref = set(other_prefixes).difference(set(rank_prefixes))
-        ffasta_path = self.path_to_final.joinpath(path_to_fasta.name)
-        prime_tmp_fasta_path = self.path_to_prime.joinpath(
-            f"{path_to_fasta.stem}_tmp.fasta"
-        )
-        prime_fasta_path = self.path_to_prime.joinpath(path_to_fasta.name)
-        with open(ffasta_path, "w") as ffasta:
-            for record in SeqIO.parse(path_to_fasta, "fasta"):
-                if record.id not in other_id:
-                    SeqIO.write(record, ffasta, "fasta")
-                else:
-                    continue
-        if len(require_pref) == 0:
-            return
-        tmp_id = self.__tmp_other_id(require_pref, other_id)
-        with open(prime_tmp_fasta_path, "w") as tmp, \
-                open(prime_fasta_path) as src:
-            for record in SeqIO.parse(src, "fasta"):
-                if record.id in tmp_id:
-                    SeqIO.write(record, tmp, "fasta")
+        queries = [i for i, record_id in zip(members, records_id)
+                   if "Contig" not in record_id]
+        contigs = [i for i, record_id in zip(members, records_id)
+                   if "Contig" in record_id and
+                   any(pref in record_id for pref in require_pref)]
+        return queries, contigs
+
+    def batches(self, uf_labels, prime_superclusters, batches_number):
+        """
+        Function does split primary superclusters which need alignment into
+        batches: each job is list of (supercluster, indices of queries,
+        indices of candidate contigs)
+        """
+        order = np.argsort(uf_labels, kind="stable")
+        sorted_labels = uf_labels[order]
+        starts = np.searchsorted(sorted_labels, prime_superclusters)
+        ends = np.searchsorted(sorted_labels, prime_superclusters,
+                               side="right")
+        jobs = []
+        for scl_num, start, end in zip(prime_superclusters.tolist(),
+                                       starts.tolist(), ends.tolist()):
+            queries, contigs = self.__contigs(order[start:end].tolist())
+            if contigs:
+                jobs.append((scl_num, queries, contigs))
+        batch_size = max(1, int(np.ceil(len(jobs) / batches_number)))
+        return [jobs[i:i + batch_size]
+                for i in range(0, len(jobs), batch_size)]
+
+    def __align(self, scl_num, queries, candidates, query_path,
+                contigs_path):
+        """
+        Function does align rank clusters of supercluster against its
+        candidate contigs and return table of hits
+        """
+        with open(query_path, "wb") as query, \
+                open(contigs_path, "wb") as contigs:
+            self.__write_records(query, queries)
+            self.__write_records(contigs, candidates)
         outfmt = "6 qseqid sseqid slen qcovhsp"
-        cline = NcbiblastnCommandline(query=ffasta_path,
-                                      subject=prime_tmp_fasta_path,
-                                      out="-",
-                                      outfmt=outfmt,
-                                      task=self.task)
+        cline = NcbiblastnCommandline(
+            query=query_path,
+            subject=contigs_path,
+            out="-",
+            outfmt=outfmt,
+            task=self.task
+        )
         output = cline()[0].strip()
         rows = [line.split() for line in output.splitlines()]
         cols = ["qseqid", "sseqid", "slen", "qcovhsp"]
@@ -57,38 +98,41 @@ class FastaFinalizer:
                       "slen": int,
                       "qcovhsp": float}
         b_tab = pd.DataFrame(rows, columns=cols).astype(data_types)
+        b_tab["scl_num"] = scl_num
+        return b_tab
+
+    def final_fasta(self, batch):
+        """
+        Function does align rank clusters of each supercluster of batch
+        against its candidate contigs and append the best contig to final
+        fasta of supercluster
+        """
+        name = f"batch{batch[0][0]}"
+        query_path = self.path_to_prime.joinpath(f"{name}_query.fasta")
+        contigs_path = self.path_to_prime.joinpath(f"{name}_contigs.fasta")
+        b_tab = pd.concat([self.__align(scl_num, queries, candidates,
+                                        query_path, contigs_path)
+                           for scl_num, queries, candidates in batch])
         if b_tab.empty:
             return
-        b_tab.rename(columns={
-            0: "qseqid",
-            1: "sseqid",
-            2: "slen",
-            3: "qcovhsp"
-        }, inplace=True)
-        best_contig_id = self.__get_best_contig(b_tab)
-        with open(ffasta_path, "a") as ffasta, \
-                open(prime_tmp_fasta_path) as tmp:
-            for record in SeqIO.parse(tmp, "fasta"):
-                if record.id == best_contig_id:
-                    SeqIO.write(record, ffasta, "fasta")
-                else:
-                    continue
-
-    def __tmp_other_id(self, pref_list, other_id):
-        other_id_tmp = []
-        for pref in pref_list:
-            for oth_id in other_id:
-                if pref in oth_id:
-                    other_id_tmp.append(oth_id)
-        return other_id_tmp
+        best_contigs = self.__get_best_contig(b_tab)
+        best_index = self.fasta_index.lookup(best_contigs["sseqid"])
+        for scl_num, i in zip(best_contigs["scl_num"], best_index.tolist()):
+            ffasta_path = self.path_to_final.joinpath(
+                f"supercluster{scl_num}.fasta")
+            with open(ffasta_path, "ab") as ffasta:
+                self.__write_records(ffasta, [i])
 
     def __get_best_contig(self,
                           blast_table):
-        contigs_id = list(np.unique(blast_table["sseqid"]))
-        table_dict = {}
-        for contig in contigs_id:
-            hits_number = len(blast_table[blast_table["sseqid"] == contig])
-            best_qcovhsp = np.max(
-                blast_table[blast_table["sseqid"] == contig]["qcovhsp"])
-            table_dict[contig] = abs(1 - hits_number * 100 / best_qcovhsp)
-        return min(table_dict, key=table_dict.get)
+        """
+        Function does select the best contig of each supercluster in one
+        grouped pass: contig with the smallest |1 - hits * 100 / best
+        qcovhsp| (the first by id among equal ones)
+        """
+        contigs = (blast_table.groupby(["scl_num", "sseqid"])["qcovhsp"]
+                   .agg(["size", "max"])
+                   .reset_index())
+        contigs["score"] = (1 - contigs["size"] * 100 / contigs["max"]).abs()
+        return (contigs.sort_values(["scl_num", "score", "sseqid"])
+                .drop_duplicates("scl_num"))
@@ -0,0 +1,162 @@
+import cProfile
+import json
+import logging
+import resource
+import time
+from pathlib import Path
+
+from prettytable import PrettyTable
+
+
+class StageProfiler:
+    """
+    Class contains methods for profiling of pipeline stages: wall time, CPU
+    time, peak RSS and I/O bytes of each stage for pipeline process and for
+    its child processes (workers of Pool and blastn; children are counted
+    when they are finished and waited). I/O of pipeline process is bytes
+    of read/write calls (page cache hits included), I/O of children is
+    bytes of blocks of disk. Peak RSS of children is maximum over run, so
+    it is recorded only for stages which raised it. Stages are saved into
+    JSON after each stage. Optionally each stage is profiled by cProfile (only
+    pipeline process) and stats are dumped into folder with the same name
+    as JSON. Disabled profiler does nothing
+    """
+
+    def __init__(self, output_dir, enabled=False, cprofile=False,
+                 name="profile"):
+        self.output_dir = Path(output_dir)
+        self.enabled = enabled or cprofile
+        self.cprofile = cprofile
+        self.name = name
+        self.path_to_json = self.output_dir.joinpath(f"{name}.json")
+        self.stages = []
+        self.__stage = None
+        self.__start = None
+        self.__profile = None
+
+    def __proc_values(self, path, keys):
+        """
+        Function does return values of keys from file of /proc (zeros if it
+        is not available)
+        """
+        values = dict.fromkeys(keys, 0)
+        try:
+            with open(path) as handle:
+                for line in handle:
+                    key, _, value = line.partition(":")
+                    if key in values:
+                        values[key] = int(value.split()[0])
+        except OSError:
+            pass
+        return values
+
+    def __reset_peak_rss(self):
+        """
+        Function does reset peak RSS of pipeline process (VmHWM), so peak is
+        measured for each stage (Linux only)
+        """
+        try:
+            with open("/proc/self/clear_refs", "w") as handle:
+                handle.write("5")
+        except OSError:
+            pass
+
+    def __snapshot(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        io = self.__proc_values("/proc/self/io", ["rchar", "wchar"])
+        return {"wall": time.perf_counter(),
+                "cpu": usage.ru_utime + usage.ru_stime,
+                "children_cpu": children.ru_utime + children.ru_stime,
+                # kilobytes on Linux
+                "children_peak_rss": children.ru_maxrss,
+                "read": io["rchar"],
+                "written": io["wchar"],
+                # blocks of 512 bytes
+                "children_read": children.ru_inblock * 512,
+                "children_written": children.ru_oublock * 512}
+
+    def start(self, stage):
+        """
+        Function does start profiling of stage (current stage is stopped)
+        """
+        if not self.enabled:
+            return
+        self.stop()
+        self.__reset_peak_rss()
+        self.__stage = stage
+        self.__start = self.__snapshot()
+        if self.cprofile:
+            self.__profile = cProfile.Profile()
+            self.__profile.enable()
+
+    def stop(self):
+        """
+        Function does stop profiling of current stage and save all stages
+        """
+        if not self.enabled or self.__stage is None:
+            return
+        if self.__profile is not None:
+            self.__profile.disable()
+            profile_dir = self.output_dir.joinpath(self.name)
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            self.__profile.dump_stats(profile_dir.joinpath(
+                f"{len(self.stages) + 1:02d}_{self.__stage}.prof"))
+            self.__profile = None
+        end = self.__snapshot()
+        peak_rss = self.__proc_values("/proc/self/status", ["VmHWM"])
+        # ru_maxrss is in kilobytes on Linux
+        self_peak = (peak_rss["VmHWM"] or
+                     resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        stage = {
+            "stage": self.__stage,
+            "wall_time": round(end["wall"] - self.__start["wall"], 3),
+            "cpu_time": round(end["cpu"] - self.__start["cpu"], 3),
+            "children_cpu_time": round(
+                end["children_cpu"] - self.__start["children_cpu"], 3),
+            "peak_rss": self_peak * 1024,
+            # maximum over all finished children of run: it is known
+            # for stage only if children of stage raised it
+            "children_peak_rss": (
+                end["children_peak_rss"] * 1024
+                if end["children_peak_rss"] > self.__start["children_peak_rss"]
+                else None),
+        }
+        for key in ["read", "written", "children_read", "children_written"]:
+            stage[f"{key}_bytes"] = end[key] - self.__start[key]
+        self.stages.append(stage)
+        self.__stage = None
+        with open(self.path_to_json, "w") as handle:
+            json.dump({"stages": self.stages}, handle, indent=4)
+
+    def log_table(self):
+        """
+        Function does log table of profiled stages
+        """
+        if not self.enabled:
+            return
+        self.stop()
+        mb = 1024 * 1024
+        table = PrettyTable()
+        table.field_names = ["Stage", "Wall, s", "CPU, s", "Children CPU, s",
+                             "Peak RSS, MB", "Children peak RSS, MB",
+                             "Read calls, MB", "Write calls, MB",
+                             "Children disk read, MB",
+                             "Children disk write, MB"]
+        for stage in self.stages:
+            table.add_row([
+                stage["stage"],
+                stage["wall_time"],
+                stage["cpu_time"],
+                stage["children_cpu_time"],
+                round(stage["peak_rss"] / mb, 1),
+                ("-" if stage["children_peak_rss"] is None
+                 else round(stage["children_peak_rss"] / mb, 1)),
+                round(stage["read_bytes"] / mb, 1),
+                round(stage["written_bytes"] / mb, 1),
+                round(stage["children_read_bytes"] / mb, 1),
+                round(stage["children_written_bytes"] / mb, 1),
+            ])
+        logging.info(f"profile of stages ({self.path_to_json}; children "
+                     f"peak RSS is shown for stages which raised peak of "
+                     f"run)\n{table}")
@@ -1,31 +1,112 @@
+import numpy as np
+
+
 class QuickUnion:
+    """
+    Disjoint-set backed by int32 array of parents. Edges are united by whole
+    arrays; root of each component is its smallest element. Connected
+    components can be also labeled by scipy.sparse.csgraph (backend="scipy")
+    """
 
-    def __init__(self, N):
-        self._id = list(range(N))
-        self._count = N
-        self._rank = [0] * N
+    def __init__(self, N, backend="numpy"):
+        self._id = np.arange(N, dtype=np.int32)
+        self.backend = backend
 
     def find(self, p):
         id = self._id
         while p != id[p]:
-            p = id[p] = id[id[p]]   # Path compression using halving.
+            id[p] = id[id[p]]   # Path compression using halving.
+            p = id[p]
         return p
 
     def union(self, p, q):
         id = self._id
-        rank = self._rank
         i = self.find(p)
         j = self.find(q)
         if i == j:
             return
-        self._count -= 1
-        if rank[i] < rank[j]:
-            id[i] = j
-        elif rank[i] > rank[j]:
-            id[j] = i
+        id[max(i, j)] = min(i, j)
+
+    def union_edges(self, p, q):
+        """
+        Function does unite all edges (pairs p[i], q[i]) at once
+        """
+        p = np.asarray(p, dtype=np.int32)
+        q = np.asarray(q, dtype=np.int32)
+        if self.backend == "scipy":
+            self.__union_scipy(p, q)
         else:
-            id[j] = i
-            rank[i] += 1
+            self.__union_numpy(p, q)
+
+    def __compress(self):
+        """
+        Function does pointer jumping until each element points to its root
+        """
+        id = self._id
+        while True:
+            parent = id[id]
+            if np.array_equal(parent, id):
+                return
+            id[:] = parent
+
+    def __union_numpy(self, p, q):
+        """
+        Roots of edge ends are hooked to the smaller root (so parent is
+        always smaller than element and cycles are impossible) and parents
+        are compressed until ends of all edges have the same root. Root of
+        many edges is hooked to the smallest of their roots at once
+        (unbuffered minimum), so hubs are merged in one pass
+        """
+        id = self._id
+        self.__compress()
+        while len(p):
+            root_p = id[p]
+            root_q = id[q]
+            crossing = root_p != root_q
+            p = p[crossing]
+            q = q[crossing]
+            if not len(p):
+                return
+            root_p = root_p[crossing]
+            root_q = root_q[crossing]
+            np.minimum.at(id, np.maximum(root_p, root_q),
+                          np.minimum(root_p, root_q))
+            self.__compress()
+
+    def __union_scipy(self, p, q):
+        """
+        Connected components of graph with new edges and edges from each
+        element to its current root
+        """
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        n = len(self._id)
+        rows = np.concatenate((p, np.arange(n, dtype=np.int32)))
+        cols = np.concatenate((q, self._id))
+        graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                           shape=(n, n))
+        _, labels = connected_components(graph, directed=False)
+        # elements are visited in increasing order, so the first element
+        # with label is the smallest one
+        _, roots = np.unique(labels, return_index=True)
+        self._id = roots[labels].astype(np.int32)
+
+    def labels(self):
+        """
+        Function does return root of each element
+        """
+        self.__compress()
+        return self._id.copy()
+
+    def components(self):
+        """
+        Function does return roots of all components and their sizes
+        """
+        return np.unique(self.labels(), return_counts=True)
+
+    @property
+    def count(self):
+        return len(self.components()[0])
 
     def __str__(self):
-        return " ".join([str(x) for x in self._id])
+        return " ".join([str(x) for x in self.labels()])
@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class ThresholdFinder:
+    """
+    Class contains methods for splitting of alignments into junk and good
+    ones by query cover. Each method returns query cover threshold (minimal
+    query cover of good alignments) and minimal identity percent of good
+    alignments. Thresholds of empty hit table (no alignments between
+    sequences) are EMPTY: there are no edges to split, so the strictest
+    thresholds are reported
+    """
+
+    EMPTY = (100.0, 100.0)
+
+    def __thresholds(self, qcovs, pident, ok_qcovs):
+        return float(ok_qcovs), float(np.min(pident[qcovs >= ok_qcovs]))
+
+    def largest_gap(self, qcovs, pident):
+        """
+        Function does exact single linkage clustering of query cover into
+        two clusters: for 1-D data it is a split at the largest gap between
+        sorted unique values (O(n log n) time and O(n) memory). If several
+        gaps are the largest the upper one is used
+        """
+        if not len(qcovs):
+            return self.EMPTY
+        values = np.unique(qcovs)
+        if len(values) < 2:
+            return self.__thresholds(qcovs, pident, values[0])
+        gaps = np.diff(values)
+        ok_qcovs = values[len(gaps) - np.argmax(gaps[::-1])]
+        return self.__thresholds(qcovs, pident, ok_qcovs)
+
+
+class QcovsHistogram:
+    """
+    Class contains histogram of query cover (BLAST reports it as integer
+    percent so each bin is one percent) with minimal identity percent in
+    each bin. Histogram is updated by chunks of alignments, so thresholds
+    can be calculated without full hit table in memory
+    """
+
+    BINS = 101
+
+    def __init__(self, counts=None, min_pident=None):
+        self.counts = (np.zeros(self.BINS, dtype=np.int64)
+                       if counts is None else counts)
+        self.min_pident = (np.full(self.BINS, np.inf)
+                           if min_pident is None else min_pident)
+
+    def update(self, qcovs, pident):
+        bins = np.clip(np.rint(qcovs), 0, self.BINS - 1).astype(np.intp)
+        self.counts += np.bincount(bins, minlength=self.BINS)
+        np.minimum.at(self.min_pident, bins, pident)
+
+    def merge(self, other):
+        self.counts += other.counts
+        np.minimum(self.min_pident, other.min_pident, out=self.min_pident)
+
+    def otsu(self):
+        """
+        Function does split histogram into two classes by Otsu method
+        (maximal between-class variance, that is the optimal 2-means
+        clustering of query cover). Empty histogram gives
+        ThresholdFinder.EMPTY
+        """
+        values = np.flatnonzero(self.counts)
+        if not len(values):
+            return ThresholdFinder.EMPTY
+        if len(values) < 2:
+            return self.__thresholds(values[0])
+        counts = self.counts[values].astype(np.float64)
+        weight = np.cumsum(counts)[:-1]
+        total = np.sum(counts)
+        mean_low = np.cumsum(counts * values)[:-1] / weight
+        mean_high = ((np.sum(counts * values) - mean_low * weight) /
+                     (total - weight))
+        variance = weight * (total - weight) * (mean_high - mean_low) ** 2
+        return self.__thresholds(values[np.argmax(variance) + 1])
+
+    def fixed(self, ok_qcovs):
+        """
+        Function does return given query cover threshold and minimal
+        identity percent of alignments above it (for thresholds chosen
+        before alignment)
+        """
+        ok_pident = np.min(self.min_pident[int(np.ceil(ok_qcovs)):],
+                           initial=100.0)
+        return float(ok_qcovs), float(ok_pident)
+
+    def __thresholds(self, ok_qcovs):
+        return float(ok_qcovs), float(np.min(self.min_pident[ok_qcovs:]))
@@ -2,11 +2,14 @@
 All configuration for REcomp
 """
 
-PIPELINE_VERSION = "2.1.3"
+PIPELINE_VERSION = "2.2.0"
 
 # default run parameters
 EVALUE = 1e-05
 CHUNK_SIZE = 10000
+COPY_STRATEGY = "auto"
+COPY_THREADS = 8
+THUMBNAIL_WIDTH = 120
 
 # consensuses files
 CONSENSUS_FILES = {"RANK1": "TAREAN_consensus_rank_1.fasta",
@@ -24,3 +27,15 @@ REFERENCES = "test_data/test_references.fasta"
 OUTPUT_DIR_IO = "test_data/test_output_io"
 OUTPUT_DIR_NIO = "test_data/test_output_nio"
 CPU_COUNT = "4"
+
+# parameters for benchmark
+BENCHMARK_OUTPUT_DIR = "benchmark_output"
+BENCHMARK_RESULTS = "benchmark/results.jsonl"
+BENCHMARK_DATASETS = 2
+BENCHMARK_CLUSTERS = 200
+BENCHMARK_CONTIGS = 3
+BENCHMARK_MIN_LENGTH = 150
+BENCHMARK_MAX_LENGTH = 1000
+BENCHMARK_LAYOUT_SIZE = 900
+BENCHMARK_REPEATS = 3
+BENCHMARK_TOLERANCE = 0.1
@@ -0,0 +1,57 @@
+import base64
+import json
+from io import BytesIO
+from pathlib import Path
+
+
+class GraphLayoutEncoder:
+    """
+    Class contains methods for embedding of graph layouts into report as
+    data URI: each picture is read (and downsampled to thumbnail if width
+    is set, requires Pillow) once, encoded data URI is memoized by path
+    """
+
+    def __init__(self, out_dir, thumbnail_width=None):
+        self.out_dir = Path(out_dir)
+        self.thumbnail_width = thumbnail_width
+        self.__uris = {}
+
+    def __thumbnail(self, path):
+        """
+        Function does return PNG of picture downsampled to thumbnail width
+        (pictures which are not wider are not changed)
+        """
+        from PIL import Image
+        with Image.open(path) as image:
+            image.thumbnail((self.thumbnail_width, image.height))
+            buffer = BytesIO()
+            image.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue()
+
+    def data_uri(self, picture):
+        if picture not in self.__uris:
+            path = self.out_dir.joinpath(picture)
+            if self.thumbnail_width is None:
+                data = path.read_bytes()
+            else:
+                data = self.__thumbnail(path)
+            self.__uris[picture] = ("data:image/png;base64," +
+                                    base64.b64encode(data).decode("utf-8"))
+        return self.__uris[picture]
+
+    def lookup_script(self, pictures):
+        """
+        Function does return script which sets pictures of images with
+        data-layout attribute from one lookup of data URI by path (each
+        picture is embedded in report once)
+        """
+        layouts = ",\n".join(
+            f"  {json.dumps(picture)}: {json.dumps(self.data_uri(picture))}"
+            for picture in pictures)
+        return ("<script>\n"
+                f"var graphLayouts = {{\n{layouts}\n}};\n"
+                "document.querySelectorAll(\"img[data-layout]\")"
+                ".forEach(function (img) {\n"
+                "  img.src = graphLayouts[img.getAttribute(\"data-layout\")];"
+                "\n});\n"
+                "</script>")
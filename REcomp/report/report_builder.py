@@ -0,0 +1,144 @@
+import json
+import shutil
+from multiprocessing import Pool
+from pathlib import Path
+
+import pandas as pd
+
+import config
+from report.report_generator import HtmlReportGenerator
+from report.summary_table import ReportTableConstructor
+
+
+class ReportBuilder:
+    """
+    Class contains checkpointed stages of report generation: report table
+    of superclusters and HTML report. Stages use only results of run (fasta
+    of superclusters, thresholds and RE results), so they are used by
+    pipeline and by --report-only which rebuilds report of finished run
+    without alignment
+    """
+
+    def __init__(self, args, work_dirs, checkpoint):
+        self.args = args
+        self.work_dirs = work_dirs
+        self.checkpoint = checkpoint
+        self.out_path = Path(args.out)
+        self.final_fasta = self.out_path.joinpath("results", "final_fasta")
+        self.thresholds_file = self.out_path.joinpath("fasta",
+                                                      "thresholds.json")
+        self.report_table_file = self.out_path.joinpath(
+            "report", "superclusters_table.sqlite")
+        self.report_csv_file = self.out_path.joinpath(
+            "report", "superclusters_table.csv")
+        self.tarean_cache = self.out_path.joinpath("cache", "tarean")
+        self.report_html = self.out_path.joinpath("report.html")
+        self.report_pages = self.out_path.joinpath("report", "pages")
+        self.report_index = self.out_path.joinpath("report",
+                                                   "report_index.js")
+
+    def report_table(self, force=False):
+        """
+        Function does create report table from fasta of superclusters and
+        tables of clusters of RE results (cluster_report.html of datasets
+        are parsed in parallel, parsed tables are cached between runs)
+        """
+        references = [self.args.references] if self.args.references else []
+        inputs = ([self.final_fasta] + references +
+                  [Path(path).joinpath("cluster_report.html")
+                   for path in self.work_dirs])
+        params = {"work_dirs": self.work_dirs,
+                  "export_csv": self.args.export_csv}
+        if not force and self.checkpoint.is_done("report_table", inputs,
+                                                 params):
+            return
+        db_constructor = ReportTableConstructor(self.tarean_cache,
+                                                self.args.copy_strategy,
+                                                config.COPY_THREADS)
+        jobs = [(prefix,
+                 Path(path).joinpath("cluster_report.html"),
+                 self.out_path.joinpath("report", "graph_layouts", prefix))
+                for path, prefix in self.work_dirs.items()]
+        pool = Pool(processes=min(self.args.cpu_number, len(jobs)))
+        clusters_table = pd.concat(
+            pool.starmap(db_constructor.process_cluster_data, jobs),
+            ignore_index=True)
+        pool.close()
+        pool.join()
+        recomp_results_table = (
+            db_constructor.recomp_results_database_construct(
+                self.final_fasta,
+                self.args.references,
+                self.args.cpu_number)
+        )
+        report_table = (
+            db_constructor.recomp_report_table_generation(
+                recomp_results_table,
+                clusters_table)
+        )
+        db_constructor.save_report_table(
+            report_table,
+            self.report_table_file,
+            self.report_csv_file if self.args.export_csv else None)
+        if not self.args.export_csv:
+            # table exported by previous run is outdated
+            self.report_csv_file.unlink(missing_ok=True)
+        checkpoint_outputs = [self.report_table_file,
+                              self.out_path.joinpath("report",
+                                                     "graph_layouts")]
+        if self.args.export_csv:
+            checkpoint_outputs.append(self.report_csv_file)
+        self.checkpoint.save("report_table", inputs, params,
+                             checkpoint_outputs)
+
+    def html_report(self, force=False):
+        """
+        Function does create HTML report (one page or index and pages) from
+        report table and thresholds of run
+        """
+        inputs = [self.report_table_file, self.thresholds_file]
+        params = {"include_other": self.args.include_other,
+                  "include_ribosomal": self.args.include_ribosomal,
+                  "thumbnails": self.args.thumbnails,
+                  "shared_images": self.args.shared_images,
+                  "page_size": self.args.page_size}
+        if not force and self.checkpoint.is_done("html_report", inputs,
+                                                 params):
+            return
+        with open(self.thresholds_file) as handle:
+            thresholds = json.load(handle)
+        report_generator = (
+            HtmlReportGenerator(self.report_table_file,
+                                self.report_html,
+                                self.args,
+                                thresholds["ok_qcovs"],
+                                thresholds["ok_pident"],
+                                thresholds["method"],
+                                (config.THUMBNAIL_WIDTH
+                                 if self.args.thumbnails else None),
+                                self.args.shared_images)
+        )
+        if self.args.page_size:
+            report_generator.generate_paged_report(self.args.page_size,
+                                                   self.args.cpu_number)
+            self.checkpoint.save("html_report", inputs, params,
+                                 [self.report_html, self.report_pages,
+                                  self.report_index])
+        else:
+            # pages of previous paged report are outdated
+            shutil.rmtree(self.report_pages, ignore_errors=True)
+            self.report_index.unlink(missing_ok=True)
+            report_generator.generate_report(self.args.cpu_number)
+            self.checkpoint.save("html_report", inputs, params,
+                                 [self.report_html])
+
+    def copy_style(self):
+        try:
+            shutil.copyfile(Path.cwd().joinpath("REcomp2",
+                                                "REcomp",
+                                                "report",
+                                                "style1.css"),
+                            self.out_path.joinpath("style1.css"))
+        except FileNotFoundError:
+            shutil.copyfile(Path.cwd().joinpath("report", "style1.css"),
+                            self.out_path.joinpath("style1.css"))
@@ -1,55 +1,265 @@
-import base64
-import itertools
+import json
 import logging
 import re
+import shutil
+from contextlib import nullcontext
+from multiprocessing import Pool
 from pathlib import Path
 
 import numpy as np
-import pandas as pd
 from sqlalchemy import create_engine
 
 from natsort import natsorted
 from yattag import Doc, indent
 
+from report.graph_layouts import GraphLayoutEncoder
+
+# report generator of worker process of Pool (it is sent to each worker
+# once, when pool is created)
+_worker_generator = None
+
+
+def _set_worker_generator(generator):
+    global _worker_generator
+    _worker_generator = generator
+
+
+def _render_fragment(job):
+    return _worker_generator.render_fragment(job)
+
 
 class HtmlReportGenerator:
+    # script of paged report which fills tables of index page from
+    # report_index.js: section is [name, number of records, page]
+    INDEX_SCRIPT = """<script>
+var index = document.getElementById("report-index");
+reportIndex.forEach(function (section) {
+  var header = document.createElement("h2");
+  header.className = section["class"] + "-header";
+  header.textContent = section.header + " (" +
+    section.superclusters.length + ")";
+  index.appendChild(header);
+  var table = document.createElement("table");
+  table.className = section["class"] + "-table";
+  var row = table.insertRow();
+  ["Supercluster", "Records", "Page"].forEach(function (column) {
+    var cell = document.createElement("th");
+    cell.textContent = column;
+    row.appendChild(cell);
+  });
+  section.superclusters.forEach(function (scl) {
+    var page = "report/pages/" + section["class"] + "-" + scl[2] + ".html";
+    var row = table.insertRow();
+    var link = document.createElement("a");
+    link.href = page + (section.anchors ? "#" + scl[0] : "");
+    link.textContent = scl[0].replace(
+      /^[^a-z]*([a-z])([a-z]*)\\D*(\\d+).*$/,
+      function (match, first, rest, number) {
+        return first.toUpperCase() + rest + " " + number;
+      });
+    row.insertCell().appendChild(link);
+    row.insertCell().textContent = scl[1];
+    var pageLink = document.createElement("a");
+    pageLink.href = page;
+    pageLink.textContent = scl[2];
+    row.insertCell().appendChild(pageLink);
+  });
+  index.appendChild(table);
+});
+</script>"""
+
     def __init__(self,
                  path_to_report_table,
                  path_to_output_html,
                  args,
                  ok_qcovs,
-                 ok_perc_identity):
+                 ok_perc_identity,
+                 threshold_method,
+                 thumbnail_width=None,
+                 shared_layouts=False):
         self.path_to_report_table = path_to_report_table
         self.path_to_output_html = path_to_output_html
         self.args = args,
         self.ok_qcovs = ok_qcovs,
         self.ok_perc_identity = ok_perc_identity,
+        self.threshold_method = threshold_method
+        self.layouts = GraphLayoutEncoder(args.out, thumbnail_width)
+        self.shared_layouts = shared_layouts
+        self.__used_layouts = {}
         self.LOGGER = logging.getLogger(__name__)
         self.LOGGER.setLevel(logging.DEBUG)
 
-    def __picture_to_string(self, picture):
-        with open(Path(self.args[0].out).joinpath(picture), "rb") as imageFile:
-            pic_str = base64.b64encode(imageFile.read())
-            return b"data:image/png;base64," + pic_str
+    def __group_superclusters(self, report_table):
+        """
+        Function does group records of report table (in order of table) by
+        supercluster type and name
+        """
+        superclusters = {}
+        for row in report_table:
+            superclusters.setdefault((row[9], row[8]), []).append(row)
+        return superclusters
 
-    def generate_report(self):
-        logging.info("report generation")
-        report_table = pd.read_csv(self.path_to_report_table)
-        engine = create_engine("sqlite://", echo=False)
-        report_table.to_sql("report_table", con=engine, index=False)
+    def __names(self, superclusters, scl_type, selected):
+        """
+        Function does return natural sorted names of superclusters of type
+        whose records are selected
+        """
+        names = [scl_name for (group_type, scl_name), rows
+                 in superclusters.items()
+                 if group_type == scl_type and selected(rows)]
+        return natsorted(list(np.unique(names)))
+
+    def __records(self, rows, source):
+        """
+        Function does return records of supercluster from source. Each
+        record is shown by the first record of supercluster with the same
+        RecordID (ids of 'other' contigs are shortened to cluster)
+        """
+        first = {}
+        for row in rows:
+            first.setdefault(row[6], row)
+        return [first[row[6]] for row in rows if row[10] == source]
+
+    def __table_header(self, doc, tag, text, fasta=False):
+        columns = ["Cluster", "ClusterID", "Proportion, %",
+                   "Number of reads", "Sequence length, bp", "Sequence",
+                   "Graph layout", "TAREAN annotation", "Feature"]
+        if fasta:
+            columns.append("Fasta")
+        with tag("tr"):
+            for column in columns:
+                with tag("th"):
+                    text(column)
+
+    def __record_row(self, doc, tag, text, scl_info, fasta=False):
+        """
+        Function does add row of RE record (consensus or 'other' contig)
+        """
+        with tag("tr"):
+            with tag("td"):
+                text(int(scl_info[1]))
+            with tag("td"):
+                text(scl_info[6])
+            with tag("td"):
+                text(round(scl_info[2], 3))
+            with tag("td"):
+                text(int(scl_info[3]))
+            with tag("td"):
+                text(len(scl_info[7]))
+            sequence = re.sub("(.{80})", "\\1\n", scl_info[7], 0)
+            with tag("td"):
+                with tag("pre"):
+                    text(sequence)
+            with tag("td"):
+                with tag("a", href=scl_info[4]):
+                    if self.shared_layouts:
+                        # picture is set by lookup script of report
+                        self.__used_layouts[scl_info[4]] = None
+                        doc.stag("img", ("data-layout", scl_info[4]),
+                                 width="120", border=0)
+                    else:
+                        doc.stag("img",
+                                 src=self.layouts.data_uri(scl_info[4]),
+                                 width="120", border=0)
+            with tag("td"):
+                text(scl_info[5])
+            with tag("td"):
+                if scl_info[11] is None:
+                    text("")
+                else:
+                    text(scl_info[11])
+            if fasta:
+                with tag("td"):
+                    with tag("a", download="Fasta", href=scl_info[12]):
+                        text("FASTA")
+
+    def __reference_row(self, doc, tag, text, scl_info):
+        """
+        Function does add row of reference: it has no RE data
+        """
+        with tag("tr"):
+            with tag("td"):
+                text("")
+            with tag("td"):
+                text(scl_info[6])
+            with tag("td"):
+                text("")
+            with tag("td"):
+                text("")
+            with tag("td"):
+                text(len(scl_info[7]))
+            sequence = re.sub("(.{80})", "\\1\n", scl_info[7], 0)
+            with tag("td"):
+                with tag("pre"):
+                    text(sequence)
+            with tag("td"):
+                text("")
+            with tag("td"):
+                text("")
+            with tag("td"):
+                if scl_info[11] is None:
+                    text("")
+                else:
+                    text(scl_info[11])
+
+    def __write(self, output, html):
+        """
+        Function does append indented top-level elements to report: they
+        are separated by new line like in indented whole document
+        """
+        if output.tell():
+            output.write("\n")
+        output.write(html)
+
+    def __inner(self, doc):
+        """
+        Function does return indented content of the only top-level element
+        of doc without its opening and closing lines
+        """
+        return "\n".join(indent(doc.getvalue()).split("\n")[1:-1])
+
+    def __sections(self, superclusters):
+        """
+        Function does return sections of report: key, type of
+        superclusters, header, class of html elements and natural sorted
+        names of superclusters. Truly unique superclusters are shown in one
+        table
+        """
+        return [
+            ("identified", "identified", "Identified superclusters",
+             "identified",
+             self.__names(superclusters, "identified", lambda rows: True)),
+            ("not_identified", "not_identified",
+             "Not identified superclusters", "not-identified",
+             self.__names(superclusters, "not_identified",
+                          lambda rows: True)),
+            ("probable_unique", "probable_unique",
+             "Probable unique superclusters", "probable-unique",
+             self.__names(superclusters, "probable_unique",
+                          lambda rows: any(row[11] is not None and
+                                           row[11] != "Truly unique"
+                                           for row in rows))),
+            ("truly_unique", "probable_unique",
+             "Truly unique superclusters", "truly-unique",
+             self.__names(superclusters, "probable_unique",
+                          lambda rows: any(row[11] == "Truly unique"
+                                           for row in rows))),
+        ]
+
+    def __head(self, base=None):
         doc, tag, text = Doc().tagtext()
         doc.asis("<!DOCTYPE html>")
         # header
         with tag("html"):
             with tag("head"):
+                if base is not None:
+                    doc.stag("base", href=base)
                 doc.stag("link", href="style1.css", rel="stylesheet")
             with tag("h1", klass="main-header"):
                 text("REcomp report")
-        result = indent(doc.getvalue())
-        with open(self.path_to_output_html, "w") as output:
-            output.write(result)
+        return doc, tag, text
 
-        # run parameters
+    def __run_parameters(self, doc, tag, text):
         with tag("h2", klass="run-parameters"):
             text("Run parameters and thresholds:")
             with tag("h4", klass="thresholds"):
@@ -60,6 +270,8 @@ class HtmlReportGenerator:
                     f"{self.ok_perc_identity[0]}%"
                 )
                 doc.stag("br")
+                text(f"Threshold calculation method: {self.threshold_method}")
+                doc.stag("br")
                 text(
                     f"Include ribosomal clusters: "
                     f"{self.args[0].include_ribosomal}"
@@ -67,501 +279,237 @@ class HtmlReportGenerator:
                 doc.stag("br")
                 text(f"Include 'Other' clusters: {self.args[0].include_other}")
                 doc.stag("br")
-        result = indent(doc.getvalue())
-        with open(self.path_to_output_html, "w") as output:
-            output.write(result)
-
-        # Identified superclusters
-        with tag("h2", klass="identified-header"):
-            text("Identified superclusters")
-        all_identified = engine.execute(
-            "SELECT SuperclusterName FROM report_table "
-            "WHERE SuperclusterType=='identified'"
-        ).fetchall()
-        all_identified = list(itertools.chain(*all_identified))
-        all_identified = natsorted(list(np.unique(all_identified)))
-        for scl in all_identified:
-            scl_name = re.search(r"[a-z]+", scl).group(0).capitalize()
-            scl_num = re.search(r"\d+", scl).group(0)
-            scl_name = f"{scl_name} {scl_num}"
-            with tag("h3", klass="supercluster-name"):
-                text(scl_name)
-            # get path to fasta
-            path_to_fasta = engine.execute(f"SELECT Path_to_fasta \
-                FROM report_table \
-                    WHERE SuperclusterType=='identified' \
-                        AND SuperclusterName=='{scl}'").fetchone()[0]
-            with tag("a", download="Supercluster fasta", href=path_to_fasta):
-                text("Supercluster fasta")
-            with tag("table", klass="identified-table"):
-                # table header
-                with tag("tr"):
-                    with tag("th"):
-                        text("Cluster")
-                    with tag("th"):
-                        text("ClusterID")
-                    with tag("th"):
-                        text("Proportion, %")
-                    with tag("th"):
-                        text("Number of reads")
-                    with tag("th"):
-                        text("Sequence length, bp")
-                    with tag("th"):
-                        text("Sequence")
-                    with tag("th"):
-                        text("Graph layout")
-                    with tag("th"):
-                        text("TAREAN annotation")
-                    with tag("th"):
-                        text("Feature")
-                # table for consensuses
-                consensuses_id = engine.execute(f"SELECT RecordID FROM report_table \
-                    WHERE SuperclusterName=='{scl}' \
-                        AND SuperclusterType=='identified' \
-                            AND RecordSource=='REconsensus'").fetchall()
-                consensuses_id = list(itertools.chain(*consensuses_id))
-                for consensus in consensuses_id:
-                    scl_info = engine.execute(f"SELECT * FROM report_table \
-                        WHERE SuperclusterName=='{scl}' \
-                            AND SuperclusterType=='identified' \
-                                AND RecordID=='{consensus}'").fetchall()[0]
-                    with tag("tr"):
-                        with tag("td"):
-                            text(int(scl_info[1]))
-                        with tag("td"):
-                            text(scl_info[6])
-                        with tag("td"):
-                            text(round(scl_info[2], 3))
-                        with tag("td"):
-                            text(int(scl_info[3]))
-                        with tag("td"):
-                            text(len(scl_info[7]))
-                        sequence = re.sub("(.{80})", "\\1\n", scl_info[7], 0)
-                        with tag("td"):
-                            with tag("pre"):
-                                text(sequence)
-                        with tag("td"):
-                            with tag("a", href=scl_info[4]):
-                                doc.stag(
-                                    "img",
-                                    src=(self.__picture_to_string(scl_info[4]).
-                                         decode("utf-8")),
-                                    width="120", border=0
-                                )
-                        with tag("td"):
-                            text(scl_info[5])
-                        with tag("td"):
-                            if scl_info[11] is None:
-                                text("")
-                            else:
-                                text(scl_info[11])
-                # other contigs
-                other_contigs_id = engine.execute(f"SELECT RecordID FROM report_table \
-                    WHERE SuperclusterName=='{scl}' \
-                        AND SuperclusterType=='identified' \
-                            AND RecordSource=='REother_contig'").fetchall()
-                other_contigs_id = list(itertools.chain(*other_contigs_id))
-                for other in other_contigs_id:
-                    scl_info = engine.execute(f"SELECT * FROM report_table \
-                        WHERE SuperclusterName=='{scl}' \
-                            AND SuperclusterType=='identified' \
-                                AND RecordID=='{other}'").fetchall()[0]
-                    with tag("tr"):
-                        with tag("td"):
-                            text(int(scl_info[1]))
-                        with tag("td"):
-                            text(scl_info[6])
-                        with tag("td"):
-                            text(round(scl_info[2], 3))
-                        with tag("td"):
-                            text(int(scl_info[3]))
-                        with tag("td"):
-                            text(len(scl_info[7]))
-                        sequence = re.sub("(.{80})", "\\1\n", scl_info[7], 0)
-                        with tag("td"):
-                            with tag("pre"):
-                                text(sequence)
-                        with tag("td"):
-                            with tag("a", href=scl_info[4]):
-                                doc.stag(
-                                    "img",
-                                    src=(self.__picture_to_string(scl_info[4]).
-                                         decode("utf-8")),
-                                    width="120", border=0
-                                )
-                        with tag("td"):
-                            text(scl_info[5])
-                        with tag("td"):
-                            if scl_info[11] is None:
-                                text("")
-                            else:
-                                text(scl_info[11])
-
-                # references
-                references_id = engine.execute(f"SELECT RecordID FROM report_table \
-                    WHERE SuperclusterName=='{scl}' \
-                        AND SuperclusterType=='identified' \
-                            AND RecordSource=='reference'").fetchall()
-                references_id = list(itertools.chain(*references_id))
-                for reference in references_id:
-                    scl_info = engine.execute(f"SELECT * FROM report_table \
-                        WHERE SuperclusterName=='{scl}' \
-                            AND SuperclusterType=='identified' \
-                                AND RecordID=='{reference}'").fetchall()[0]
-                    with tag("tr"):
-                        with tag("td"):
-                            text("")
-                        with tag("td"):
-                            text(scl_info[6])
-                        with tag("td"):
-                            text("")
-                        with tag("td"):
-                            text("")
-                        with tag("td"):
-                            text(len(scl_info[7]))
-                        sequence = re.sub("(.{80})", "\\1\n", scl_info[7], 0)
-                        with tag("td"):
-                            with tag("pre"):
-                                text(sequence)
-                        with tag("td"):
-                            text("")
-                        with tag("td"):
-                            text("")
-                        with tag("td"):
-                            if scl_info[11] is None:
-                                text("")
-                            else:
-                                text(scl_info[11])
-
-        # Not identified superclusters
-        with tag("h2", klass="not-identified-header"):
-            text("Not identified superclusters")
-        not_identified = engine.execute(
-            "SELECT SuperclusterName FROM report_table WHERE SuperclusterType="
-            "='not_identified'"
-        ).fetchall()
-        not_identified = list(itertools.chain(*not_identified))
-        not_identified = natsorted(list(np.unique(not_identified)))
-        for scl in not_identified:
-            scl_name = re.search(r"[a-z]+", scl).group(0).capitalize()
-            scl_num = re.search(r"\d+", scl).group(0)
-            scl_name = f"{scl_name} {scl_num}"
-            with tag("h3", klass="supercluster-name"):
+
+    def __section_header(self, header, klass):
+        doc, tag, text = Doc().tagtext()
+        with tag("h2", klass=f"{klass}-header"):
+            text(header)
+        return indent(doc.getvalue())
+
+    def __supercluster(self, scl_type, klass, scl, rows, anchor=False):
+        """
+        Function does return html of supercluster: its name, link to fasta
+        and table of records. Paged report marks name by anchor
+        """
+        doc, tag, text = Doc().tagtext()
+        scl_name = re.search(r"[a-z]+", scl).group(0).capitalize()
+        scl_num = re.search(r"\d+", scl).group(0)
+        scl_name = f"{scl_name} {scl_num}"
+        if anchor:
+            with tag("h3", klass="supercluster-name", id=scl):
                 text(scl_name)
-            # get path to fasta
-            path_to_fasta = engine.execute(f"SELECT Path_to_fasta \
-                FROM report_table \
-                    WHERE SuperclusterType=='not_identified' \
-                        AND SuperclusterName=='{scl}'").fetchone()[0]
-            with tag("a", download="Supercluster fasta", href=path_to_fasta):
-                text("Supercluster fasta")
-            with tag("table", klass="not-identified-table"):
-                # table header
-                with tag("tr"):
-                    with tag("th"):
-                        text("Cluster")
-                    with tag("th"):
-                        text("ClusterID")
-                    with tag("th"):
-                        text("Proportion, %")
-                    with tag("th"):
-                        text("Number of reads")
-                    with tag("th"):
-                        text("Sequence length, bp")
-                    with tag("th"):
-                        text("Sequence")
-                    with tag("th"):
-                        text("Graph layout")
-                    with tag("th"):
-                        text("TAREAN annotation")
-                    with tag("th"):
-                        text("Feature")
-                # table for consensuses
-                consensuses_id = engine.execute(f"SELECT RecordID FROM report_table \
-                    WHERE SuperclusterName=='{scl}' \
-                        AND SuperclusterType=='not_identified' \
-                            AND RecordSource=='REconsensus'").fetchall()
-                consensuses_id = list(itertools.chain(*consensuses_id))
-                for consensus in consensuses_id:
-                    scl_info = engine.execute(f"SELECT * FROM report_table \
-                        WHERE SuperclusterName=='{scl}' \
-                            AND SuperclusterType=='not_identified' \
-                                AND RecordID=='{consensus}'").fetchall()[0]
-                    with tag("tr"):
-                        with tag("td"):
-                            text(int(scl_info[1]))
-                        with tag("td"):
-                            text(scl_info[6])
-                        with tag("td"):
-                            text(round(scl_info[2], 3))
-                        with tag("td"):
-                            text(int(scl_info[3]))
-                        with tag("td"):
-                            text(len(scl_info[7]))
-                        sequence = re.sub("(.{80})", "\\1\n", scl_info[7], 0)
-                        with tag("td"):
-                            with tag("pre"):
-                                text(sequence)
-                        with tag("td"):
-                            with tag("a", href=scl_info[4]):
-                                doc.stag(
-                                    "img",
-                                    src=(self.__picture_to_string(scl_info[4]).
-                                         decode("utf-8")),
-                                    width="120", border=0
-                                )
-                        with tag("td"):
-                            text(scl_info[5])
-                        with tag("td"):
-                            if scl_info[11] is None:
-                                text("")
-                            else:
-                                text(scl_info[11])
-                # other contigs
-                other_contigs_id = engine.execute(f"SELECT RecordID FROM report_table \
-                    WHERE SuperclusterName=='{scl}' \
-                        AND SuperclusterType=='not_identified' \
-                            AND RecordSource=='REother_contig'").fetchall()
-                other_contigs_id = list(itertools.chain(*other_contigs_id))
-                for other in other_contigs_id:
-                    scl_info = engine.execute(f"SELECT * FROM report_table \
-                        WHERE SuperclusterName=='{scl}' \
-                            AND SuperclusterType=='not_identified' \
-                                AND RecordID=='{other}'").fetchall()[0]
-                    with tag("tr"):
-                        with tag("td"):
-                            text(int(scl_info[1]))
-                        with tag("td"):
-                            text(scl_info[6])
-                        with tag("td"):
-                            text(round(scl_info[2], 3))
-                        with tag("td"):
-                            text(int(scl_info[3]))
-                        with tag("td"):
-                            text(len(scl_info[7]))
-                        sequence = re.sub("(.{80})", "\\1\n", scl_info[7], 0)
-                        with tag("td"):
-                            with tag("pre"):
-                                text(sequence)
-                        with tag("td"):
-                            with tag("a", href=scl_info[4]):
-                                doc.stag(
-                                    "img",
-                                    src=(self.__picture_to_string(scl_info[4]).
-                                         decode("utf-8")),
-                                    width="120", border=0
-                                )
-                        with tag("td"):
-                            text(scl_info[5])
-                        with tag("td"):
-                            if scl_info[11] is None:
-                                text("")
-                            else:
-                                text(scl_info[11])
-
-        # Probable unique superclusters
-        with tag("h2", klass="probable-unique-header"):
-            text("Probable unique superclusters")
-        probable_unique = engine.execute(
-            "SELECT SuperclusterName FROM report_table WHERE SuperclusterType="
-            "='probable_unique' AND Features!='Truly unique'"
-        ).fetchall()
-        probable_unique = list(itertools.chain(*probable_unique))
-        probable_unique = natsorted(list(np.unique(probable_unique)))
-        for scl in probable_unique:
-            scl_name = re.search(r"[a-z]+", scl).group(0).capitalize()
-            scl_num = re.search(r"\d+", scl).group(0)
-            scl_name = f"{scl_name} {scl_num}"
+        else:
             with tag("h3", klass="supercluster-name"):
                 text(scl_name)
-            # get path to fasta
-            path_to_fasta = engine.execute(f"SELECT Path_to_fasta \
-                FROM report_table \
-                    WHERE SuperclusterType=='probable_unique' \
-                        AND SuperclusterName=='{scl}'").fetchone()[0]
-            with tag("a", download="Supercluster fasta", href=path_to_fasta):
-                text("Supercluster fasta")
-            with tag("table", klass="probable-unique-table"):
-                # table header
-                with tag("tr"):
-                    with tag("th"):
-                        text("Cluster")
-                    with tag("th"):
-                        text("ClusterID")
-                    with tag("th"):
-                        text("Proportion, %")
-                    with tag("th"):
-                        text("Number of reads")
-                    with tag("th"):
-                        text("Sequence length, bp")
-                    with tag("th"):
-                        text("Sequence")
-                    with tag("th"):
-                        text("Graph layout")
-                    with tag("th"):
-                        text("TAREAN annotation")
-                    with tag("th"):
-                        text("Feature")
-                # table for consensuses
-                consensuses_id = engine.execute(f"SELECT RecordID FROM report_table \
-                    WHERE SuperclusterName=='{scl}' \
-                        AND SuperclusterType=='probable_unique' \
-                            AND RecordSource=='REconsensus'").fetchall()
-                consensuses_id = list(itertools.chain(*consensuses_id))
-                for consensus in consensuses_id:
-                    scl_info = engine.execute(f"SELECT * FROM report_table \
-                        WHERE SuperclusterName=='{scl}' \
-                            AND SuperclusterType=='probable_unique' \
-                                AND RecordID=='{consensus}'").fetchall()[0]
-                    with tag("tr"):
-                        with tag("td"):
-                            text(int(scl_info[1]))
-                        with tag("td"):
-                            text(scl_info[6])
-                        with tag("td"):
-                            text(round(scl_info[2], 3))
-                        with tag("td"):
-                            text(int(scl_info[3]))
-                        with tag("td"):
-                            text(len(scl_info[7]))
-                        sequence = re.sub("(.{80})", "\\1\n", scl_info[7], 0)
-                        with tag("td"):
-                            with tag("pre"):
-                                text(sequence)
-                        with tag("td"):
-                            with tag("a", href=scl_info[4]):
-                                doc.stag(
-                                    "img",
-                                    src=(self.__picture_to_string(scl_info[4]).
-                                         decode("utf-8")),
-                                    width="120", border=0
-                                )
-                        with tag("td"):
-                            text(scl_info[5])
-                        with tag("td"):
-                            if scl_info[11] is None:
-                                text("")
-                            else:
-                                text(scl_info[11])
-                # other contigs
-                other_contigs_id = engine.execute(f"SELECT RecordID FROM report_table \
-                    WHERE SuperclusterName=='{scl}' \
-                        AND SuperclusterType=='probable_unique' \
-                            AND RecordSource=='REother_contig'").fetchall()
-                other_contigs_id = list(itertools.chain(*other_contigs_id))
-                for other in other_contigs_id:
-                    scl_info = engine.execute(f"SELECT * FROM report_table \
-                        WHERE SuperclusterName=='{scl}' \
-                            AND SuperclusterType=='probable_unique' \
-                                AND RecordID=='{other}'").fetchall()[0]
-                    with tag("tr"):
-                        with tag("td"):
-                            text(int(scl_info[1]))
-                        with tag("td"):
-                            text(scl_info[6])
-                        with tag("td"):
-                            text(round(scl_info[2], 3))
-                        with tag("td"):
-                            text(int(scl_info[3]))
-                        with tag("td"):
-                            text(len(scl_info[7]))
-                        sequence = re.sub("(.{80})", "\\1\n", scl_info[7], 0)
-                        with tag("td"):
-                            with tag("pre"):
-                                text(sequence)
-                        with tag("td"):
-                            with tag("a", href=scl_info[4]):
-                                doc.stag(
-                                    "img",
-                                    src=(self.__picture_to_string(scl_info[4]).
-                                         decode("utf-8")),
-                                    width="120", border=0
-                                )
-                        with tag("td"):
-                            text(scl_info[5])
-                        with tag("td"):
-                            if scl_info[11] is None:
-                                text("")
-                            else:
-                                text(scl_info[11])
-
-        # truly unique
-        with tag("h2", klass="truly-unique-header"):
-            text("Truly unique superclusters")
-        truly_unique = engine.execute(
-            "SELECT SuperclusterName FROM report_table WHERE SuperclusterType="
-            "='probable_unique' AND Features=='Truly unique'"
-        ).fetchall()
-        truly_unique = list(itertools.chain(*truly_unique))
-        truly_unique = natsorted(list(np.unique(truly_unique)))
+        # path to fasta from the first record of supercluster
+        path_to_fasta = rows[0][12]
+        with tag("a", download="Supercluster fasta", href=path_to_fasta):
+            text("Supercluster fasta")
+        with tag("table", klass=f"{klass}-table"):
+            self.__table_header(doc, tag, text)
+            for scl_info in self.__records(rows, "REconsensus"):
+                self.__record_row(doc, tag, text, scl_info)
+            for scl_info in self.__records(rows, "REother_contig"):
+                self.__record_row(doc, tag, text, scl_info)
+            for scl_info in self.__records(rows, "reference"):
+                self.__reference_row(doc, tag, text, scl_info)
+        return indent(doc.getvalue())
+
+    def __truly_unique_table(self):
+        """
+        Function does return opening tag and header of truly unique table:
+        table is closed by hand after rows of all superclusters
+        """
+        doc, tag, text = Doc().tagtext()
         with tag("table", klass="probable-unique-table"):
-            # table header
-            with tag("tr"):
-                with tag("th"):
-                    text("Cluster")
-                with tag("th"):
-                    text("ClusterID")
-                with tag("th"):
-                    text("Proportion, %")
-                with tag("th"):
-                    text("Number of reads")
-                with tag("th"):
-                    text("Sequence length, bp")
-                with tag("th"):
-                    text("Sequence")
-                with tag("th"):
-                    text("Graph layout")
-                with tag("th"):
-                    text("TAREAN annotation")
-                with tag("th"):
-                    text("Feature")
-                with tag("th"):
-                    text("Fasta")
-            # table for consensuses
-            for scl in truly_unique:
-                consensuses_id = engine.execute(f"SELECT RecordID FROM report_table \
-                    WHERE SuperclusterName=='{scl}' \
-                        AND SuperclusterType=='probable_unique' \
-                            AND RecordSource=='REconsensus'").fetchall()
-                consensuses_id = list(itertools.chain(*consensuses_id))
-                for consensus in consensuses_id:
-                    scl_info = engine.execute(f"SELECT * FROM report_table \
-                        WHERE SuperclusterName=='{scl}' \
-                            AND SuperclusterType=='probable_unique' \
-                                AND RecordID=='{consensus}'").fetchall()[0]
-                    with tag("tr"):
-                        with tag("td"):
-                            text(int(scl_info[1]))
-                        with tag("td"):
-                            text(scl_info[6])
-                        with tag("td"):
-                            text(round(scl_info[2], 3))
-                        with tag("td"):
-                            text(int(scl_info[3]))
-                        with tag("td"):
-                            text(len(scl_info[7]))
-                        sequence = re.sub("(.{80})", "\\1\n", scl_info[7], 0)
-                        with tag("td"):
-                            with tag("pre"):
-                                text(sequence)
-                        with tag("td"):
-                            with tag("a", href=scl_info[4]):
-                                doc.stag(
-                                    "img",
-                                    src=(self.__picture_to_string(scl_info[4]).
-                                         decode("utf-8")),
-                                    width="120", border=0
-                                )
-                        with tag("td"):
-                            text(scl_info[5])
-                        with tag("td"):
-                            if scl_info[11] is None:
-                                text("")
-                            else:
-                                text(scl_info[11])
-                        with tag("td"):
-                            with tag("a", download="Fasta", href=scl_info[12]):
-                                text("FASTA")
-        result = indent(doc.getvalue())
+            self.__table_header(doc, tag, text, fasta=True)
+        return indent(doc.getvalue()).rsplit("\n", 1)[0]
+
+    def __truly_unique_rows(self, rows):
+        """
+        Function does return rows of truly unique supercluster: they are
+        rendered inside of temporary table to be indented as rows of table
+        """
+        scl_records = self.__records(rows, "REconsensus")
+        if not scl_records:
+            return None
+        doc, tag, text = Doc().tagtext()
+        with tag("table"):
+            for scl_info in scl_records:
+                self.__record_row(doc, tag, text, scl_info, fasta=True)
+        return self.__inner(doc)
+
+    def __load(self):
+        engine = create_engine(f"sqlite:///{self.path_to_report_table}",
+                               echo=False)
+        report_table = [tuple(row) for row in engine.execute(
+            "SELECT * FROM report_table").fetchall()]
+        return self.__group_superclusters(report_table)
+
+    def render_fragment(self, job):
+        """
+        Function does render html of one supercluster and return it with
+        graph layouts which are set by lookup script (shared images). Job
+        is key of section, type and class of superclusters, name of
+        supercluster, its records and anchor flag
+        """
+        key, scl_type, klass, scl, rows, anchor = job
+        self.__used_layouts = {}
+        if key == "truly_unique":
+            html = self.__truly_unique_rows(rows)
+        else:
+            html = self.__supercluster(scl_type, klass, scl, rows, anchor)
+        return html, list(self.__used_layouts)
+
+    def __fragments(self, jobs, pool, cpu_number):
+        """
+        Function does render fragments of superclusters by pool of
+        processes (if it is given) and return them in order of jobs. Only
+        jobs are sent to workers: generator is held by each worker, so
+        memoized data URIs of main process are not sent with each batch
+        """
+        if pool is None:
+            return map(self.render_fragment, jobs)
+        return pool.imap(_render_fragment, jobs,
+                         chunksize=max(1, len(jobs) //
+                                       (cpu_number * 4)))
+
+    def __pool(self, cpu_number):
+        """
+        Function does return pool of processes which hold copy of generator
+        (made before rendering, without memoized data URIs) or empty context
+        (pool is None) for one process. Pool is terminated on exit of
+        context, so workers do not outlive failed report
+        """
+        if cpu_number < 2:
+            return nullcontext()
+        return Pool(processes=cpu_number,
+                    initializer=_set_worker_generator,
+                    initargs=(self,))
+
+    def __write_fragments(self, output, jobs, pool, cpu_number,
+                          used_layouts):
+        for html, layouts in self.__fragments(jobs, pool, cpu_number):
+            used_layouts.update(dict.fromkeys(layouts))
+            if html is not None:
+                self.__write(output, html)
+
+    def generate_report(self, cpu_number=1):
+        """
+        Function does write report by sections: superclusters are rendered
+        by pool of cpu_number processes and their fragments are written to
+        report in natural sorted order as soon as they are ready, so only
+        few sections are kept in memory. Rows of truly unique table are
+        written by superclusters too
+        """
+        logging.info("report generation")
+        superclusters = self.__load()
+        used_layouts = {}
+        with self.__pool(cpu_number) as pool, \
+                open(self.path_to_output_html, "w") as output:
+            doc, tag, text = self.__head()
+            self.__run_parameters(doc, tag, text)
+            self.__write(output, indent(doc.getvalue()))
+            for key, scl_type, header, klass, names in self.__sections(
+                    superclusters):
+                self.__write(output, self.__section_header(header, klass))
+                if key == "truly_unique":
+                    self.__write(output, self.__truly_unique_table())
+                jobs = [(key, scl_type, klass, scl,
+                         superclusters[(scl_type, scl)], False)
+                        for scl in names]
+                self.__write_fragments(output, jobs, pool, cpu_number,
+                                       used_layouts)
+                if key == "truly_unique":
+                    self.__write(output, "</table>")
+            if self.shared_layouts:
+                self.__write(output,
+                             self.layouts.lookup_script(used_layouts))
+
+    def __page_path(self, klass, page):
+        return f"report/pages/{klass}-{page}.html"
+
+    def __navigation(self, klass, page, pages):
+        doc, tag, text = Doc().tagtext()
+        with tag("p", klass="page-navigation"):
+            with tag("a", href=Path(self.path_to_output_html).name):
+                text("Index")
+            if page > 1:
+                with tag("a", href=self.__page_path(klass, page - 1)):
+                    text("Previous")
+            text(f" Page {page} of {pages} ")
+            if page < pages:
+                with tag("a", href=self.__page_path(klass, page + 1)):
+                    text("Next")
+        return indent(doc.getvalue())
+
+    def __write_page(self, output, key, header, klass, page, pages, jobs,
+                     pool, cpu_number):
+        used_layouts = {}
+        # links of page are relative to output directory
+        doc, tag, text = self.__head(base="../../")
+        self.__write(output, indent(doc.getvalue()))
+        self.__write(output, self.__navigation(klass, page, pages))
+        self.__write(output, self.__section_header(header, klass))
+        if key == "truly_unique":
+            self.__write(output, self.__truly_unique_table())
+        self.__write_fragments(output, jobs, pool, cpu_number, used_layouts)
+        if key == "truly_unique":
+            self.__write(output, "</table>")
+        if self.shared_layouts:
+            self.__write(output, self.layouts.lookup_script(used_layouts))
+
+    def generate_paged_report(self, page_size, cpu_number=1):
+        """
+        Function does write report by pages: superclusters of each section
+        are written into pages of page_size superclusters (report/pages)
+        and report is index page whose tables are filled by script from
+        compact index (report/report_index.js). Superclusters are rendered
+        by pool of cpu_number processes
+        """
+        logging.info("report generation")
+        superclusters = self.__load()
+        out_path = Path(self.args[0].out)
+        pages_path = out_path.joinpath("report", "pages")
+        shutil.rmtree(pages_path, ignore_errors=True)
+        pages_path.mkdir(parents=True)
+        report_index = []
+        with self.__pool(cpu_number) as pool:
+            for key, scl_type, header, klass, names in self.__sections(
+                    superclusters):
+                pages = max(1, int(np.ceil(len(names) / page_size)))
+                index = []
+                for page in range(1, pages + 1):
+                    shard = names[(page - 1) * page_size:page * page_size]
+                    jobs = [(key, scl_type, klass, scl,
+                             superclusters[(scl_type, scl)],
+                             key != "truly_unique")
+                            for scl in shard]
+                    with open(out_path.joinpath(
+                            self.__page_path(klass, page)), "w") as output:
+                        self.__write_page(output, key, header, klass, page,
+                                          pages, jobs, pool, cpu_number)
+                    index.extend([scl, len(superclusters[(scl_type, scl)]),
+                                  page]
+                                 for scl in shard)
+                report_index.append({"header": header,
+                                     "class": klass,
+                                     "anchors": key != "truly_unique",
+                                     "superclusters": index})
+        with open(out_path.joinpath("report", "report_index.js"),
+                  "w") as output:
+            output.write("var reportIndex = ")
+            json.dump(report_index, output, separators=(",", ":"))
+            output.write(";\n")
+
         with open(self.path_to_output_html, "w") as output:
-            output.write(result)
+            doc, tag, text = self.__head()
+            self.__run_parameters(doc, tag, text)
+            self.__write(output, indent(doc.getvalue()))
+            doc, tag, text = Doc().tagtext()
+            with tag("div", id="report-index"):
+                pass
+            with tag("script", src="report/report_index.js"):
+                pass
+            self.__write(output, indent(doc.getvalue()))
+            self.__write(output, self.INDEX_SCRIPT)
@@ -1,11 +1,16 @@
+import hashlib
+import itertools
+import json
+import os
 import re
-import shutil
+import sqlite3
+from multiprocessing import Pool
 from pathlib import Path
 
 import pandas as pd
 from Bio import SeqIO
-from bs4 import BeautifulSoup as bs
-from sqlalchemy import create_engine
+
+from common.copy_files import FileCopier
 
 
 class ReportTableConstructor:
@@ -14,24 +19,106 @@ class ReportTableConstructor:
     REcomp
     """
 
+    __references_id = frozenset()
+
+    SCRIPT_TAG = b'<script type="application/json"'
+    SCRIPT_END = b"</script>"
+    BLOCK_SIZE = 1 << 20
+    INDEXED_COLUMNS = ["SuperclusterName", "SuperclusterType",
+                       "RecordSource", "RecordID"]
+    # columns of report table and their types
+    REPORT_COLUMNS = {"Prefix": "object",
+                      "Cluster": "object",
+                      "Proportion": "float64",
+                      "Number_of_reads": "Int64",
+                      "Graph_layout": "object",
+                      "TAREAN_annotation": "object",
+                      "RecordID": "object",
+                      "RecordSeq": "object",
+                      "SuperclusterName": "object",
+                      "SuperclusterType": "object",
+                      "RecordSource": "object",
+                      "Features": "object",
+                      "Path_to_fasta": "object"}
+
+    def __init__(self, cache_dir=None, copy_strategy="auto", copy_threads=8):
+        self.cache_dir = cache_dir
+        self.copy_strategy = copy_strategy
+        self.copy_threads = copy_threads
+
+    def __extract_script(self, path):
+        """
+        Function does read cluster_report.html by blocks and return only
+        content of the first <script type="application/json"> element
+        """
+        buffer = b""
+        script = None
+        with open(path, "rb") as tarean_report:
+            for block in iter(lambda: tarean_report.read(self.BLOCK_SIZE),
+                              b""):
+                if script is None:
+                    buffer += block
+                    tag = buffer.find(self.SCRIPT_TAG)
+                    if tag == -1:
+                        # keep tail which can contain beginning of tag
+                        buffer = buffer[-len(self.SCRIPT_TAG):]
+                        continue
+                    tag_end = buffer.find(b">", tag)
+                    if tag_end == -1:
+                        buffer = buffer[tag:]
+                        continue
+                    script = bytearray()
+                    block = buffer[tag_end + 1:]
+                # end of script is searched only in new data
+                search_from = max(len(script) - len(self.SCRIPT_END), 0)
+                script += block
+                end = script.find(self.SCRIPT_END, search_from)
+                if end != -1:
+                    return script[:end].decode("utf-8")
+        raise ValueError(f"\nTable of clusters is not found in {path}\n")
+
     def parse_tarean_report(self, path):
-        with open(path, "r") as tarean_report:
-            soup = bs(tarean_report, features="lxml")
-            cluster_list = str(soup.find("script",
-                                         {"type": "application/json"}))
-            cluster_list = re.findall(r"\[\[.*\]\]",
-                                      cluster_list)[0][1:-1].split("],[")
-            cluster_list = [col.strip("[").strip("]") for col in cluster_list]
-            cluster_list = [col.split(",") for col in cluster_list]
-            return cluster_list
+        """
+        Function does return columns of clusters table (data of DataTables
+        widget) from cluster_report.html. Parsed table is cached by path,
+        modification time and size of report. If report does not exist
+        anymore (RE results were moved after run), cached table is used
+        """
+        resolved = str(Path(path).resolve())
+        cache_file = None
+        cached = None
+        if self.cache_dir is not None:
+            name = hashlib.sha1(resolved.encode("utf-8")).hexdigest()
+            cache_file = Path(self.cache_dir).joinpath(f"{name}.json")
+            if cache_file.exists():
+                with open(cache_file) as cache:
+                    cached = json.load(cache)
+        if not Path(path).exists():
+            if cached is None:
+                raise FileNotFoundError(
+                    f"\n{path} is not found and its table of clusters is "
+                    f"not cached\n")
+            return cached["data"]
+        stat = Path(path).stat()
+        key = {"path": resolved,
+               "mtime_ns": stat.st_mtime_ns,
+               "size": stat.st_size}
+        if cached is not None and cached["key"] == key:
+            return cached["data"]
+        cluster_list = json.loads(self.__extract_script(path))["x"]["data"]
+        if cache_file is not None:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_file, "w") as cache:
+                json.dump({"key": key, "data": cluster_list}, cache)
+        return cluster_list
 
     def __return_graph_layouts_paths(self,
                                      value,
                                      repex_results_path,
                                      recomp_results_path):
         """
-        Function does copy of all graph_layout.png from all folders with
-        results was analyzed and returns path to copied files
+        Function does return path of graph_layout.png in folder with RE
+        results and path of its copy in report
         """
         gl_repex_path = re.search(r"seqclust.*png",
                                   value.split(">")[0]).group(0)
@@ -42,9 +129,7 @@ class ReportTableConstructor:
             Path(recomp_results_path).
             joinpath(re.search(r"dir_CL[0-9]+.*", gl_repex_path).group(0))
         )
-        Path(copy_to_path).parent.mkdir(parents=True, exist_ok=True)
-        shutil.copyfile(copy_from_path, copy_to_path)
-        return copy_to_path
+        return copy_from_path, copy_to_path
 
     def process_cluster_data(self,
                              prefix,
@@ -52,22 +137,37 @@ class ReportTableConstructor:
                              recomp_results_path):
         """
         Function does parse cluster_report.html from each folder with RE
-        results and return table with results
+        results, copy graph layouts of clusters into report and return
+        table with results. Graph layouts which are missing in RE results
+        are taken from report (copied by previous run)
         """
         cluster_list = self.parse_tarean_report(repex_results_path)
-        cluster_num = [re.search(r"\d+", number).group(0)
+        cluster_num = [re.search(r"\d+", str(number)).group(0)
                        for number in cluster_list[0]]
         cluster_proportion = [float(value) for value in cluster_list[3]]
         cluster_number_of_reads = [int(value) for value in cluster_list[5]]
-        cluster_graph_layout = [
-            self.__return_graph_layouts_paths(value,
+        graph_layouts = [
+            self.__return_graph_layouts_paths(str(value),
                                               repex_results_path,
                                               recomp_results_path)
             for value in cluster_list[6]
         ]
+        # graph layouts copied into report by previous run are kept if RE
+        # results were moved
+        missing = [copy_to for copy_from, copy_to in graph_layouts
+                   if not copy_from.exists()]
+        for copy_to in missing:
+            assert copy_to.exists(), (
+                f"Graph layout {copy_to} is not found in report and in RE "
+                f"results")
+        missing = set(missing)
+        FileCopier(self.copy_strategy, self.copy_threads).copy_files(
+            dict.fromkeys((copy_from, copy_to)
+                          for copy_from, copy_to in graph_layouts
+                          if copy_to not in missing))
         cluster_graph_layout = [re.search(r"report.*", str(path)).group(0)
-                                for path in cluster_graph_layout]
-        cluster_annotation = [re.search(r"[\w\s\(\)]+", value).group(0)
+                                for _, path in graph_layouts]
+        cluster_annotation = [re.search(r"[\w\s\(\)]+", str(value)).group(0)
                               for value in cluster_list[10]]
         prefix = [prefix for _ in range(len(cluster_num))]
         cluster_dataframe = pd.DataFrame({"Prefix": prefix,
@@ -87,176 +187,158 @@ class ReportTableConstructor:
                                                           str})
         return cluster_dataframe
 
-    def __define_scl_type(self,
-                          path_to_fasta,
-                          path_to_references):
+    @classmethod
+    def set_references(cls, references_id):
         """
-        Function define type of supercluster in fasta file
+        Function does set ids of references in worker process (they are
+        passed once per worker, not with each file)
         """
-        if path_to_references:
-            references = set(SeqIO.to_dict(SeqIO.parse(path_to_references,
-                                                       "fasta")).keys())
-        else:
-            references = []
-        fasta_id = set(list(SeqIO.to_dict(SeqIO.parse(path_to_fasta,
-                                                      "fasta")).keys()))
-        if len(fasta_id.intersection(references)) >= 1:
+        cls.__references_id = references_id
+
+    def __define_scl_type(self, records_id):
+        """
+        Function define type of supercluster by ids of its records
+        """
+        if not self.__references_id.isdisjoint(records_id):
             return "identified"
-        else:
-            if len(fasta_id.intersection(references)) == 0 and \
-               sum([True if "_TR_1_x_" in i else False for i in fasta_id]) > 1:
-                return "not_identified"
+        if sum("_TR_1_x_" in i for i in set(records_id)) > 1:
+            return "not_identified"
         return "probable_unique"
 
+    def supercluster_columns(self, file):
+        """
+        Function does parse fasta of supercluster once and return columns
+        of its rows
+        """
+        scl_records = list(SeqIO.to_dict(SeqIO.parse(file,
+                                                     "fasta")).values())
+        records_id = [record.id for record in scl_records]
+        number = len(records_id)
+        path_to_fasta = re.search(
+            r"[a-z\_]+\/[a-z\_]+\/[a-z0-9\_]+\.[a-z\_]+$",
+            str(file)).group(0)
+        return {
+            "RecordID": records_id,
+            "RecordSeq": [str(record.seq) for record in scl_records],
+            "ClusterName": [file.stem] * number,
+            "ClusterType": [self.__define_scl_type(records_id)] * number,
+            "RecordSource": ["reference" if record in self.__references_id
+                             else "REother_contig" if "Contig" in record
+                             else "REconsensus" for record in records_id],
+            "Path_to_fasta": [path_to_fasta] * number,
+            "Uniqueness": ["Truly unique" if number == 1 else ""] * number
+        }
+
     def recomp_results_database_construct(self,
                                           path_to_fasta,
-                                          path_to_references):
+                                          path_to_references,
+                                          cpu_number=1):
         """
         Function does compile table with data about each superclusters from
-        results of REcomp
+        results of REcomp. Ids of references are read once and fasta of
+        superclusters are parsed in parallel, table is built from columns
+        of all files at once
         """
         if path_to_references:
-            references_id = list(SeqIO.to_dict(SeqIO.parse(path_to_references,
-                                                           "fasta")).keys())
+            references_id = frozenset(
+                SeqIO.to_dict(SeqIO.parse(path_to_references, "fasta")))
         else:
-            references_id = []
+            references_id = frozenset()
         paths = [path for path in path_to_fasta.rglob("*.fasta")
                  if any(map(str.isdigit, Path(path).name))]
-        recomp_results_table = pd.DataFrame()
-        for file in paths:
-            scl_records = list(SeqIO.to_dict(SeqIO.parse(file,
-                                                         "fasta")).values())
-            records_id = [scl_id.id for scl_id in scl_records]
-            records_seq = [scl_seq.seq for scl_seq in scl_records]
-            records_source = ["reference" if record in references_id else
-                              "REother_contig" if "Contig" in record else
-                              "REconsensus" for record in records_id]
-            scl_name = [file.stem] * len(scl_records)
-            uniqueness = ["Truly unique" if len(scl_records) == 1
-                          else "" for _ in range(len(scl_records))]
-            path_to_fasta = [
-                re.search(r"[a-z\_]+\/[a-z\_]+\/[a-z0-9\_]+\.[a-z\_]+$",
-                          str(file)).group(0) for _ in range(len(records_id))]
-            cluster_type = (
-                [self.__define_scl_type(file, path_to_references)]
-                * len(scl_name)
-            )
-            dataframe = pd.DataFrame({"RecordID": records_id,
-                                      "RecordSeq": records_seq,
-                                      "ClusterName": scl_name,
-                                      "ClusterType": cluster_type,
-                                      "RecordSource": records_source,
-                                      "Path_to_fasta": path_to_fasta,
-                                      "Uniqueness": uniqueness})
-            dataframe = dataframe.astype({"RecordID": str,
-                                          "RecordSeq": str,
-                                          "ClusterName": str,
-                                          "ClusterType": str,
-                                          "RecordSource": str,
-                                          "Path_to_fasta": str,
-                                          "Uniqueness": str})
-            recomp_results_table = (
-                recomp_results_table.append(dataframe, ignore_index=True)
-            )
-        return recomp_results_table
+        if not paths:
+            return pd.DataFrame()
+        with Pool(processes=cpu_number,
+                  initializer=self.set_references,
+                  initargs=(references_id,)) as pool:
+            columns = pool.map(self.supercluster_columns, paths,
+                               chunksize=max(1, len(paths) //
+                                             (cpu_number * 4)))
+        recomp_results_table = pd.DataFrame({
+            name: list(itertools.chain(*[file[name] for file in columns]))
+            for name in columns[0]
+        })
+        return recomp_results_table.astype(str)
 
     def recomp_report_table_generation(self, recomp_table, repex_table):
         """
         Function creates report table with information about all records
-        from REcomp results - superclusters_table.csv
+        from REcomp results - superclusters_table.csv. Prefix and cluster of
+        RE records are parsed from RecordID and joined with table of RE
+        clusters by one merge on (Prefix, Cluster). Table without
+        superclusters has the same columns
+        """
+        if recomp_table.empty:
+            return pd.DataFrame({
+                name: pd.Series(dtype=dtype)
+                for name, dtype in self.REPORT_COLUMNS.items()})
+        record_id = recomp_table["RecordID"]
+        is_reference = recomp_table["RecordSource"] == "reference"
+        is_consensus = recomp_table["RecordSource"] == "REconsensus"
+        cluster_part = record_id.str.split("_").str[1].fillna("")
+        cluster_part = cluster_part.where(
+            is_consensus, cluster_part.str.split("Contig").str[0])
+        keys = pd.DataFrame({
+            "Prefix": record_id.str.extract(r"^([a-zA-Z0-9]+)",
+                                            expand=False),
+            "Cluster": cluster_part.str.extract(r"([0-9]+)", expand=False)
+        })
+        keys["Key"] = pd.to_numeric(keys["Cluster"].where(~is_reference))
+        repex_table = (repex_table.rename(columns={"Cluster": "Key"})
+                       .drop_duplicates(["Prefix", "Key"]))
+        report_table = keys.merge(repex_table,
+                                  on=["Prefix", "Key"],
+                                  how="left",
+                                  indicator=True)
+        report_table.index = recomp_table.index
+        missing = (report_table["_merge"] != "both") & ~is_reference
+        assert not missing.any(), (
+            f"Cluster of {record_id[missing].iloc[0]} is not found in "
+            f"RE results")
+        report_table = report_table.drop(columns=["Key", "_merge"])
+        # left join of references makes integer column float
+        report_table["Number_of_reads"] = (
+            report_table["Number_of_reads"].astype("Int64"))
+        report_table["RecordID"] = record_id.where(
+            is_reference | is_consensus,
+            record_id.str.extract(r"^([a-zA-Z0-9]+_[a-zA-Z0-9]+)",
+                                  expand=False))
+        report_table["RecordSeq"] = recomp_table["RecordSeq"]
+        report_table["SuperclusterName"] = recomp_table["ClusterName"]
+        report_table["SuperclusterType"] = recomp_table["ClusterType"]
+        report_table["RecordSource"] = recomp_table["RecordSource"]
+        report_table["Features"] = recomp_table["Uniqueness"].where(
+            is_consensus, "")
+        report_table.loc[is_reference, "Features"] = "Reference"
+        report_table["Path_to_fasta"] = recomp_table["Path_to_fasta"]
+        # references have no RE data
+        re_columns = ["Prefix", "Cluster", "Proportion", "Number_of_reads",
+                      "Graph_layout", "TAREAN_annotation"]
+        if is_reference.any():
+            report_table[re_columns] = report_table[re_columns].astype(object)
+            report_table.loc[is_reference, re_columns] = ""
+        return report_table.reset_index(drop=True)
+
+    def save_report_table(self, report_table, path_to_database,
+                          path_to_csv=None):
+        """
+        Function does write report table into SQLite database (table
+        report_table) with indices on columns used for selection of records.
+        Empty values are stored as NULL. Database is written into temporary
+        file and replaces previous one at once. Optionally table is exported
+        as CSV
         """
-        report_table = pd.DataFrame()
-        engine = create_engine("sqlite://", echo=False)
-        repex_table.to_sql("repex_table", con=engine, index=False)
-        for row in recomp_table.itertuples(index=False):
-            if row[4] == "reference":
-                table = pd.DataFrame({"Prefix": [""],
-                                      "Cluster": [""],
-                                      "Proportion": [""],
-                                      "Number_of_reads": [""],
-                                      "Graph_layout": [""],
-                                      "TAREAN_annotation": [""],
-                                      "RecordID": [row[0]],
-                                      "RecordSeq": [row[1]],
-                                      "SuperclusterName": [row[2]],
-                                      "SuperclusterType": [row[3]],
-                                      "RecordSource": [row[4]],
-                                      "Features": ["Reference"],
-                                      "Path_to_fasta": [row[5]]})
-                report_table = report_table.append(table, ignore_index=True)
-            elif row[4] == "REconsensus":
-                prefix = re.search(r"^[a-zA-Z0-9]+", row[0]).group(0)
-                cluster = re.search(r"[0-9]+", row[0].split("_")[1]).group(0)
-                proportion = engine.execute(f"SELECT Proportion \
-                    FROM repex_table \
-                        WHERE Prefix='{prefix}' \
-                            AND Cluster='{cluster}'").fetchall()
-                number_of_reads = engine.execute(f"SELECT Number_of_reads \
-                    FROM repex_table \
-                        WHERE Prefix='{prefix}' \
-                            AND Cluster='{cluster}'").fetchall()
-                grapth_layout = engine.execute(f"SELECT Graph_layout \
-                    FROM repex_table \
-                        WHERE Prefix='{prefix}' \
-                            AND Cluster='{cluster}'").fetchall()
-                tarean_annotation = engine.execute(f"SELECT TAREAN_annotation \
-                    FROM repex_table \
-                        WHERE Prefix='{prefix}' \
-                            AND Cluster='{cluster}'").fetchall()
-                table = pd.DataFrame({"Prefix": [prefix],
-                                      "Cluster": [cluster],
-                                      "Proportion": [proportion[0][0]],
-                                      "Number_of_reads":
-                                          [number_of_reads[0][0]],
-                                      "Graph_layout": [grapth_layout[0][0]],
-                                      "TAREAN_annotation":
-                                      [tarean_annotation[0][0]],
-                                      "RecordID": [row[0]],
-                                      "RecordSeq": [row[1]],
-                                      "SuperclusterName": [row[2]],
-                                      "SuperclusterType": [row[3]],
-                                      "RecordSource": [row[4]],
-                                      "Features": [row[6]],
-                                      "Path_to_fasta": [row[5]]})
-                report_table = report_table.append(table, ignore_index=True)
-            else:
-                prefix = re.search(r"^[a-zA-Z0-9]+", row[0]).group(0)
-                cluster = re.search(r"[0-9]+",
-                                    row[0].split("_")[1].
-                                    split("Contig")[0]).group(0)
-                record_id = re.search(r"^[a-zA-Z0-9]+_[a-zA-Z0-9]+",
-                                      row[0]).group(0)
-                feature = ""
-                proportion = engine.execute(f"SELECT Proportion \
-                    FROM repex_table \
-                        WHERE Prefix='{prefix}' \
-                            AND Cluster='{cluster}'").fetchall()
-                number_of_reads = engine.execute(f"SELECT Number_of_reads \
-                    FROM repex_table \
-                        WHERE Prefix='{prefix}' \
-                            AND Cluster='{cluster}'").fetchall()
-                grapth_layout = engine.execute(f"SELECT Graph_layout \
-                    FROM repex_table \
-                        WHERE Prefix='{prefix}' \
-                            AND Cluster='{cluster}'").fetchall()
-                tarean_annotation = engine.execute(f"SELECT TAREAN_annotation \
-                    FROM repex_table \
-                        WHERE Prefix='{prefix}' \
-                            AND Cluster='{cluster}'").fetchall()
-                table = pd.DataFrame({"Prefix": [prefix],
-                                      "Cluster": [cluster],
-                                      "Proportion": [proportion[0][0]],
-                                      "Number_of_reads":
-                                      [number_of_reads[0][0]],
-                                      "Graph_layout": [grapth_layout[0][0]],
-                                      "TAREAN_annotation":
-                                          [tarean_annotation[0][0]],
-                                      "RecordID": [record_id],
-                                      "RecordSeq": [row[1]],
-                                      "SuperclusterName": [row[2]],
-                                      "SuperclusterType": [row[3]],
-                                      "RecordSource": [row[4]],
-                                      "Features": [feature],
-                                      "Path_to_fasta": [row[5]]})
-                report_table = report_table.append(table, ignore_index=True)
-        return report_table
+        path_to_database = Path(path_to_database)
+        tmp = path_to_database.with_suffix(".tmp")
+        if tmp.exists():
+            tmp.unlink()
+        with sqlite3.connect(tmp) as connection:
+            (report_table.where(report_table != "")
+             .to_sql("report_table", connection, index=False))
+            for column in self.INDEXED_COLUMNS:
+                connection.execute(f"CREATE INDEX idx_{column} "
+                                   f"ON report_table ({column})")
+        connection.close()
+        os.replace(tmp, path_to_database)
+        if path_to_csv is not None:
+            report_table.to_csv(path_to_csv, index=False)
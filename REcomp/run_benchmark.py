@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of pipeline stages on synthetic RE results
+"""
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+import config
+from benchmark.micro_benchmarks import StageBenchmarks
+from benchmark.results import BenchmarkResults
+from benchmark.synthetic_re import SyntheticREGenerator
+from common.check_input import CheckInput
+
+parser = argparse.ArgumentParser(description=(
+    "Benchmark of REcomp2 stages on synthetic RepeatExplorer results"
+))
+parser.add_argument("out", help=("path to output directory (default: "
+                                 f"{config.BENCHMARK_OUTPUT_DIR})"),
+                    nargs="?", default=config.BENCHMARK_OUTPUT_DIR)
+parser.add_argument("-d", "--datasets",
+                    help=("number of RE results "
+                          f"(default: {config.BENCHMARK_DATASETS})"),
+                    type=int, default=config.BENCHMARK_DATASETS,
+                    metavar="N")
+parser.add_argument("-n", "--clusters",
+                    help=("number of clusters of each RE result "
+                          f"(default: {config.BENCHMARK_CLUSTERS})"),
+                    type=int, default=config.BENCHMARK_CLUSTERS,
+                    metavar="N")
+parser.add_argument("--contigs",
+                    help=("number of contigs of each cluster "
+                          f"(default: {config.BENCHMARK_CONTIGS})"),
+                    type=int, default=config.BENCHMARK_CONTIGS,
+                    metavar="N")
+parser.add_argument("--min-length",
+                    help=("minimal length of sequences "
+                          f"(default: {config.BENCHMARK_MIN_LENGTH})"),
+                    type=int, default=config.BENCHMARK_MIN_LENGTH,
+                    dest="min_length", metavar="LENGTH")
+parser.add_argument("--max-length",
+                    help=("maximal length of sequences "
+                          f"(default: {config.BENCHMARK_MAX_LENGTH})"),
+                    type=int, default=config.BENCHMARK_MAX_LENGTH,
+                    dest="max_length", metavar="LENGTH")
+parser.add_argument("--layout-size",
+                    help=("width and height of graph layouts in pixels "
+                          f"(default: {config.BENCHMARK_LAYOUT_SIZE})"),
+                    type=int, default=config.BENCHMARK_LAYOUT_SIZE,
+                    dest="layout_size", metavar="PIXELS")
+parser.add_argument("--seed", help="seed of generator (default: 1)",
+                    type=int, default=1)
+parser.add_argument("--generate-only",
+                    help=("only generate RE results (e.g. for full run of "
+                          "pipeline with --profile)"),
+                    action="store_true", dest="generate_only")
+parser.add_argument("-c", help="number of CPU to use (default: 1)",
+                    type=int, default=1,
+                    dest="cpu_number", metavar="CPU")
+parser.add_argument("-io", "--include-other",
+                    help=(
+                        "include `other` contigs and clusters "
+                        "in analysis (default: False)"
+                    ),
+                    action="store_true", dest="include_other")
+parser.add_argument("-ir", "--include-ribosomal",
+                    action="store_true",
+                    help=(
+                        "include rDNA clusters (rank 4) in analysis "
+                        "(default: False)"
+                    ),
+                    dest="include_ribosomal")
+parser.add_argument("--copy-strategy",
+                    help=(
+                        "how graph layouts of clusters are copied into "
+                        "report (default: auto)"
+                    ),
+                    choices=["auto", "hardlink", "reflink", "copy"],
+                    default=config.COPY_STRATEGY,
+                    dest="copy_strategy")
+parser.add_argument("--thumbnails",
+                    help=(
+                        "embed graph layouts into report as thumbnails "
+                        "(requires Pillow)"
+                    ),
+                    action="store_true")
+parser.add_argument("--shared-images",
+                    help="embed each graph layout into report once",
+                    action="store_true",
+                    dest="shared_images")
+parser.add_argument("--page-size",
+                    help=("write report by pages of SIZE superclusters "
+                          "(default: one page)"),
+                    type=int,
+                    dest="page_size",
+                    metavar="SIZE")
+parser.add_argument("--repeats",
+                    help=("number of runs of each stage "
+                          f"(default: {config.BENCHMARK_REPEATS})"),
+                    type=int, default=config.BENCHMARK_REPEATS)
+# stored results are kept near the script, whatever the current directory
+# is
+benchmark_results = Path(__file__).resolve().parent.joinpath(
+    config.BENCHMARK_RESULTS)
+parser.add_argument("--results",
+                    help=("path to file of stored results "
+                          f"(default: {benchmark_results})"),
+                    default=str(benchmark_results))
+parser.add_argument("--compare",
+                    help=("compare with the last run of COMMIT (default: "
+                          "the last run of another commit)"),
+                    metavar="COMMIT")
+parser.add_argument("--tolerance",
+                    help=("stage is regression if it is slower than "
+                          "baseline by more than this fraction "
+                          f"(default: {config.BENCHMARK_TOLERANCE})"),
+                    type=float, default=config.BENCHMARK_TOLERANCE)
+args = parser.parse_args()
+# options of report stages which are not changed by benchmark
+args.export_csv = False
+
+logging.basicConfig(level=logging.INFO,
+                    format=("\n%(asctime)s - %(funcName)s - "
+                            "%(levelname)s -\n%(message)s\n"),)
+
+assert args.repeats > 0, "Number of repeats must be positive"
+assert args.page_size is None or args.page_size > 0, (
+    "Page size must be positive")
+if args.thumbnails:
+    CheckInput().check_module("PIL")
+
+generator = SyntheticREGenerator(args.datasets,
+                                 args.clusters,
+                                 args.contigs,
+                                 args.min_length,
+                                 args.max_length,
+                                 args.layout_size,
+                                 args.seed)
+benchmarks = StageBenchmarks(generator, args)
+logging.info("generation of synthetic RE results")
+work_dirs = benchmarks.generate()
+if args.generate_only:
+    logging.info(
+        f"RE results: '{' '.join(work_dirs)}'\n"
+        f"prefixes: '{' '.join(work_dirs.values())}'\n"
+        f"references: {args.references}")
+    sys.exit(0)
+
+stages = benchmarks.run()
+params = generator.params()
+params.update({option: getattr(args, option)
+               for option in ["cpu_number", "include_other",
+                              "include_ribosomal", "copy_strategy",
+                              "thumbnails", "shared_images", "page_size"]})
+results = BenchmarkResults(args.results)
+run = results.save(params, stages)
+with open(Path(args.out).joinpath("benchmark.json"), "w") as handle:
+    json.dump(run, handle, indent=4)
+logging.info(f"results of commit {run['commit']}"
+             f"{' (uncommitted changes)' if run['dirty'] else ''} "
+             f"are saved into {args.results}")
+
+baseline = results.baseline(run, args.compare)
+if baseline is None:
+    logging.info("there is no stored run to compare with (the same "
+                 "parameters are required)")
+    sys.exit(0)
+table, regressions = results.compare(baseline, run, args.tolerance)
+logging.info(f"comparison with run of commit {baseline['commit']} "
+             f"({baseline['date']})\n{table}")
+if regressions:
+    logging.warning(f"stages slower than baseline: {', '.join(regressions)}")
+    sys.exit(1)
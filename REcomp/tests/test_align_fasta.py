@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+from common.align_fasta import FastaAligner
+
+
+def test_pair_passes_by_reverse_direction():
+    # pair is aligned in one direction only: query cover is 21, but two
+    # HSPs cover 54 of 100 nt of subject (as reverse alignment would)
+    qseqid = np.array([0, 0, 2], dtype=np.int32)
+    sseqid = np.array([1, 1, 3], dtype=np.int32)
+    cover = FastaAligner.subject_cover(qseqid, sseqid,
+                                       np.array([1, 60, 11], dtype=np.int32),
+                                       np.array([40, 73, 30], dtype=np.int32),
+                                       np.array([100, 100, 200],
+                                                dtype=np.int32))
+    assert cover.tolist() == [54, 54, 10]
+    qcovs = np.maximum(np.array([21, 21, 15], dtype=np.float32), cover)
+    first, second, _, pair_cover = FastaAligner.symmetrize(
+        qseqid, sseqid, np.full(3, 90, dtype=np.float32), qcovs)
+    assert first.tolist() == [0, 2]
+    assert second.tolist() == [1, 3]
+    assert pair_cover.tolist() == [54, 15]
+    assert (pair_cover >= 32).tolist() == [True, False]
+
+
+def test_overlapping_hsps_are_counted_once():
+    cover = FastaAligner.subject_cover(np.array([0, 0, 0], dtype=np.int32),
+                                       np.array([1, 1, 1], dtype=np.int32),
+                                       np.array([50, 1, 30], dtype=np.int32),
+                                       np.array([10, 40, 45], dtype=np.int32),
+                                       np.array([100, 100, 100],
+                                                dtype=np.int32))
+    # HSP 50..10 is on minus strand, union is 1..50
+    assert cover.tolist() == [50, 50, 50]
+
+
+def test_one_way_hsps_are_counted_in_both_directions(tmp_path):
+    # records 0 and 1 are in query chunk, record 2 is in subject chunk
+    blast = tmp_path.joinpath("blastn")
+    blast.write_text("#!/bin/sh\n"
+                     "printf 'a\\tb\\t90\\t80\\t1\\t80\\t100\\n"
+                     "b\\ta\\t90\\t80\\t1\\t80\\t100\\n"
+                     "a\\tc\\t95\\t20\\t1\\t40\\t100\\n"
+                     "a\\tc\\t85\\t20\\t61\\t70\\t100\\n'\n")
+    blast.chmod(0o755)
+    chunk = tmp_path.joinpath("fasta0.fasta")
+    chunk.write_text(">a\nACGT\n>b\nACGT\n")
+
+    class Index:
+        def lookup(self, records_id):
+            return np.array(["abc".index(i) for i in records_id],
+                            dtype=np.int32)
+
+    aligner = FastaAligner(10, "blastn", 1000, Index())
+    path = os.environ["PATH"]
+    os.environ["PATH"] = f"{tmp_path}{os.pathsep}{path}"
+    try:
+        first, second, cover, pident, qcovs = aligner.align_fasta(
+            (chunk, [chunk]))
+    finally:
+        os.environ["PATH"] = path
+    assert list(zip(first.tolist(), second.tolist())) == [(0, 1), (0, 2)]
+    assert cover.tolist() == [80, 50]
+    assert sorted(zip(qcovs.tolist(), pident.tolist())) == [
+        (20, 85), (20, 95), (50, 85), (50, 95), (80, 90), (80, 90)]
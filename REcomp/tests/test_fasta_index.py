@@ -0,0 +1,24 @@
+from common.fasta_index import FastaIndex
+
+
+def test_non_ascii_ids(tmp_path):
+    fasta = tmp_path.joinpath("fasta.fasta")
+    fasta.write_text(">A_CL1_TR_1_x_4nt\nACGT\n>Б_CL1Contig1 μ\nTTGCA\n",
+                     encoding="utf-8")
+    fasta_index = FastaIndex.build(fasta)
+    records_id = ["Б_CL1Contig1", "A_CL1_TR_1_x_4nt"]
+    assert fasta_index.lookup(records_id).tolist() == [1, 0]
+    assert fasta_index.ids[1].decode() == "Б_CL1Contig1"
+    assert fasta_index.raw(1) == ">Б_CL1Contig1 μ\nTTGCA\n".encode()
+
+
+def test_empty_fasta(tmp_path):
+    fasta = tmp_path.joinpath("fasta.fasta")
+    fasta.write_bytes(b"")
+    fasta_index = FastaIndex.build(fasta)
+    assert len(fasta_index) == 0
+    # empty file is not memory-mapped
+    assert fasta_index._FastaIndex__buffer() == b""
+    assert fasta_index.raw_range(0, 0) == b""
+    assert list(fasta_index.iter_raw()) == []
+    assert fasta_index.lookup([]).tolist() == []
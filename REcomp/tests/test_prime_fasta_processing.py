@@ -0,0 +1,68 @@
+import os
+import sys
+
+import numpy as np
+
+from common.fasta_index import FastaIndex
+from common.prime_fasta_processing import FastaFinalizer
+
+# blastn stand-in: logs ids of query and subject of each call and reports
+# hits which depend only on pair of ids
+BLASTN = '''#!{python}
+import argparse
+import zlib
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-query")
+parser.add_argument("-subject")
+args, _ = parser.parse_known_args()
+
+
+def ids(path):
+    return [line[1:].split()[0] for line in open(path) if line[0] == ">"]
+
+
+queries, subjects = ids(args.query), ids(args.subject)
+with open("{log}", "a") as log:
+    log.write(" ".join(queries + subjects) + "\\n")
+for query in queries:
+    for subject in subjects:
+        pair = zlib.crc32(f"{{query}} {{subject}}".encode())
+        for hsp in range(pair % 3 + 1):
+            print(query, subject, 100, (pair >> hsp) % 90 + 10, sep="\\t")
+'''
+
+RECORDS = ["A_CL1_TR_1_x_10nt", "B_CL1Contig1", "B_CL1Contig2",
+           "A_CL2_TR_1_x_10nt", "B_CL2Contig1", "B_CL2Contig2",
+           "C_CL2Contig1", "A_CL3_TR_1_x_10nt", "C_CL3Contig1",
+           "C_CL3Contig2"]
+LABELS = [1, 1, 1, 2, 2, 2, 2, 3, 3, 3]
+
+
+def finalize(tmp_path, name, batches_number):
+    final = tmp_path.joinpath(name)
+    final.mkdir()
+    finalizer = FastaFinalizer(tmp_path, final, ["A", "B", "C"], "blastn",
+                               FastaIndex(tmp_path.joinpath("fasta.fasta")))
+    for batch in finalizer.batches(np.array(LABELS), np.array([1, 2, 3]),
+                                   batches_number):
+        finalizer.final_fasta(batch)
+    return {path.name: path.read_text() for path in final.iterdir()}
+
+
+def test_batches_choose_the_same_contigs(tmp_path, monkeypatch):
+    log = tmp_path.joinpath("calls.log")
+    blast = tmp_path.joinpath("blastn")
+    blast.write_text(BLASTN.format(python=sys.executable, log=log))
+    blast.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    tmp_path.joinpath("fasta.fasta").write_text(
+        "".join(f">{i}\nACGTACGTAC\n" for i in RECORDS))
+    batched = finalize(tmp_path, "batched", 1)
+    # each supercluster is aligned by its own blastn
+    calls = [set(line.split()) for line in log.read_text().splitlines()]
+    assert [{LABELS[RECORDS.index(i)] for i in call}
+            for call in calls] == [{1}, {2}, {3}]
+    assert batched == finalize(tmp_path, "unbatched", 3)
+    assert sorted(batched) == ["supercluster1.fasta", "supercluster2.fasta",
+                               "supercluster3.fasta"]
@@ -0,0 +1,24 @@
+import sqlite3
+
+import pandas as pd
+
+from report.summary_table import ReportTableConstructor
+
+
+def test_empty_report_table(tmp_path):
+    constructor = ReportTableConstructor()
+    report_table = constructor.recomp_report_table_generation(
+        pd.DataFrame(), pd.DataFrame())
+    database = tmp_path.joinpath("superclusters_table.sqlite")
+    constructor.save_report_table(report_table, database)
+    with sqlite3.connect(database) as connection:
+        columns = [row[1] for row in connection.execute(
+            "PRAGMA table_info(report_table)")]
+        indices = [row[1] for row in connection.execute(
+            "PRAGMA index_list(report_table)")]
+        rows = connection.execute("SELECT * FROM report_table").fetchall()
+    connection.close()
+    assert columns == list(ReportTableConstructor.REPORT_COLUMNS)
+    assert sorted(indices) == sorted(
+        f"idx_{column}" for column in ReportTableConstructor.INDEXED_COLUMNS)
+    assert rows == []
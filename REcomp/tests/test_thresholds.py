@@ -0,0 +1,18 @@
+import numpy as np
+
+from common.thresholds import QcovsHistogram, ThresholdFinder
+
+
+def test_empty_hit_table():
+    empty = np.zeros(0, dtype=np.float32)
+    assert ThresholdFinder().largest_gap(empty, empty) == (100.0, 100.0)
+    histogram = QcovsHistogram()
+    histogram.update(empty, empty)
+    assert histogram.otsu() == (100.0, 100.0)
+    assert histogram.fixed(50) == (50.0, 100.0)
+
+
+def test_largest_gap():
+    qcovs = np.array([5, 10, 12, 80, 90], dtype=np.float32)
+    pident = np.array([70, 75, 80, 85, 95], dtype=np.float32)
+    assert ThresholdFinder().largest_gap(qcovs, pident) == (80.0, 85.0)